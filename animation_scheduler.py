@@ -0,0 +1,155 @@
+"""
+GIF Animation Scheduler
+-----------------------
+Plays frame sequences with their own GIF frame durations against a
+monotonic clock. The frame on screen is always computed from the time the
+clip started, not by counting ticks, so callback jitter never adds up to
+drift: a late tick simply lands on a later frame (the frames in between
+are skipped and counted) instead of slowing the animation down. Runs of
+identical consecutive frames (the same object, e.g. one shared PhotoImage
+of a deduplicated frame) are merged into one frame held for their summed
+duration, so the player sleeps through held poses; a clip that ends up
+with a single frame is static and does not schedule any tick at all.
+
+A clip can be preceded by a one-shot transition clip (e.g. a cross-fade or
+an "idle_to_sleep" style GIF); the looping clip starts exactly when the
+transition ends.
+
+The player itself knows nothing about Tk: it is given `show(frame)`,
+`after(ms, fn)` and `after_cancel(job)` callables (window.after /
+window.after_cancel in the desktop pet).
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import bisect
+import math
+import time
+
+MIN_FRAME_MS = 20   # GIFs with 0 / 10 ms frames would otherwise spin
+
+
+# =========================
+# 1. Clip timing
+# =========================
+class Clip:
+    def __init__(self, frames, durations, loop=True):
+        if not frames:
+            raise ValueError("Clip needs at least one frame")
+        durations = list(durations or [])
+        durations += [100] * (len(frames) - len(durations))
+        self.frames = []
+        self.sources = []   # index in `frames` of every (merged) frame
+        self.loop = loop
+        self.ends = []      # end of every frame, seconds from the clip start
+        t = 0.0
+        for i, (frame, d) in enumerate(zip(frames, durations)):
+            t += max(MIN_FRAME_MS, int(d)) / 1000.0
+            if self.frames and frame is self.frames[-1]:
+                self.ends[-1] = t
+                continue
+            self.frames.append(frame)
+            self.sources.append(i)
+            self.ends.append(t)
+        self.length = t
+        self.start = 0.0
+
+    @property
+    def static(self):
+        return len(self.frames) == 1 and self.loop
+
+    def position(self, now):
+        """
+        (frame index, seconds until the next frame) at `now`.
+        The wait is None for a static clip; the index is None once a
+        one-shot clip has ended.
+        """
+        if self.static:
+            return 0, None
+        elapsed = now - self.start
+        if self.loop:
+            elapsed %= self.length
+        elif elapsed >= self.length:
+            return None, 0.0
+        i = bisect.bisect_right(self.ends, elapsed)
+        return i, self.ends[i] - elapsed
+
+
+# =========================
+# 2. Player
+# =========================
+class AnimationPlayer:
+    def __init__(self, show, after, after_cancel, clock=time.monotonic):
+        self.show = show
+        self.after = after
+        self.after_cancel = after_cancel
+        self.clock = clock
+        self.key = None         # identifies the looping clip being played
+        self.clip = None
+        self.index = -1         # frame of self.clip on screen
+        self.shown = 0
+        self.skipped = 0
+        self._queue = []
+        self._job = None
+
+    @property
+    def in_transition(self):
+        return bool(self._queue)
+
+    @property
+    def source_index(self):
+        """Index of the frame on screen in the frames given to play(), or -1"""
+        return self.clip.sources[self.index] if self.index >= 0 else -1
+
+    def play(self, key, frames, durations, transition=None):
+        """
+        Loop `frames` (after the optional (frames, durations) transition).
+        Playing the key that is already playing is a no-op, so this can be
+        called whenever the wanted animation might have changed.
+        """
+        if key == self.key:
+            return False
+        self.key = key
+        self._queue = []
+        if transition is not None:
+            self._queue.append(Clip(*transition, loop=False))
+        self._queue.append(Clip(frames, durations, loop=True))
+        self._next_clip(self.clock())
+        return True
+
+    def stop(self):
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+
+    def _next_clip(self, start):
+        self.clip = self._queue.pop(0)
+        self.clip.start = start
+        self.index = -1
+        self.stop()
+        self._tick()
+
+    def _tick(self):
+        self._job = None
+        now = self.clock()
+        index, wait = self.clip.position(now)
+        if index is None:
+            # transition over: the loop starts where the transition ended
+            self._next_clip(self.clip.start + self.clip.length)
+            return
+
+        if index != self.index:
+            if self.index >= 0:
+                self.skipped += (index - self.index - 1) % len(self.clip.frames)
+            self.show(self.clip.frames[index])
+            self.shown += 1
+            self.index = index
+
+        if wait is not None:
+            self._job = self.after(max(1, math.ceil(wait * 1000)), self._tick)
+
+    def stats(self):
+        return {"key": self.key, "shown": self.shown, "skipped": self.skipped,
+                "ticking": self._job is not None}
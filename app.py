@@ -19,6 +19,7 @@ Date: December 2025
 """
 import streamlit as st
 from multiprocessing import Process, Manager
+from emotion_client import fetch_latest, server_address_from_config
 
 pet_process = None
 shared_state = None
@@ -107,6 +108,18 @@ def main():
     shared_state["x"] = x
     shared_state["y"] = y
 
+    # 2.7 Live emotion from the emotion server (if one is configured)
+    server = server_address_from_config()
+    if server:
+        st.divider()
+        st.subheader("Live Emotion")
+        latest = fetch_latest(server, channels=("events", "preview"))
+        changed = latest.get("changed")
+        st.write(f"Current emotion: **{changed['label'] if changed else 'unknown'}**")
+        if "preview" in latest:
+            st.image(latest["preview"]["jpeg"], caption="Camera preview")
+        st.button("Refresh")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,219 @@
+"""
+Asyncio API for the Emotion Stream
+----------------------------------
+Async access to real_time.EmotionStream for asyncio applications (web
+servers, bots, async UIs):
+
+    async with AsyncEmotionStream() as stream:
+        async for event in stream.subscribe("events"):
+            print(event["label"])
+
+The blocking pipeline (camera, detection, model) keeps running on its own
+threads, and run() is started through the event loop's executor, so the
+loop itself never blocks. Results cross into the loop with at most one
+pending call_soon_threadsafe for all channels. On the "results", "faces",
+"stats" and "frames" channels every subscriber holds only the latest
+value: a slow subscriber skips stale items instead of queueing them, and
+never slows down the pipeline or the other subscribers. "events" are
+discrete (a change and a snapshot often come from the same frame), so
+they are queued in a small per-subscriber FIFO instead, where a full
+queue drops snapshots before change events. Any number of subscribers
+share the stream without extra threads.
+
+Channels:
+- "results": {"label", "conf", "probs"} for every classified frame
+- "faces":   list of per-face dicts (see start_emotion_stream)
+- "events":  emotion change / snapshot events (see emotion_events.py)
+- "stats":   periodic stats snapshots (see EmotionStream.stats)
+- "frames":  (seq, preview frame) pairs, only with frames=True
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import asyncio
+import collections
+import threading
+
+from real_time import EmotionStream
+
+CHANNELS = ("results", "faces", "events", "stats", "frames")
+QUEUED_CHANNELS = {"events": 64}   # channel -> FIFO length; the others keep the latest value
+
+
+# =========================
+# 1. Latest-value subscription
+# =========================
+class Subscription:
+    """
+    Async iterator over one channel. Holds up to `maxlen` unread items
+    (1 by default: a new item replaces one the subscriber has not read
+    yet). Items dropped because the subscriber fell behind are counted in
+    `dropped`; with maxlen > 1, snapshot events are dropped before others.
+    """
+    def __init__(self, hub, channel, maxlen=1):
+        self.hub = hub
+        self.channel = channel
+        self.maxlen = maxlen
+        self.dropped = 0
+        self.closed = False
+        self._items = collections.deque()
+        self._event = asyncio.Event()
+
+    def _put(self, item):
+        if len(self._items) >= self.maxlen:
+            self.dropped += 1
+            snapshots = [i for i in self._items
+                         if isinstance(i, dict) and i.get("type") == "snapshot"]
+            if snapshots:
+                self._items.remove(snapshots[0])
+            else:
+                self._items.popleft()
+        self._items.append(item)
+        self._event.set()
+
+    def _close(self):
+        self.closed = True
+        self._event.set()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self._items:
+            if self.closed:
+                raise StopAsyncIteration
+            self._event.clear()
+            await self._event.wait()
+        return self._items.popleft()
+
+
+# =========================
+# 2. Async stream
+# =========================
+class AsyncEmotionStream:
+    """
+    Keyword arguments are passed to real_time.EmotionStream (config, source,
+    backend, engine, state, ...). The preview window is off by default.
+    frames=True also publishes the preview frames (this enables the preview
+    beautify pass, so leave it off if nobody needs frames).
+    """
+    def __init__(self, show_window=False, frames=False, **stream_kwargs):
+        self.stream_kwargs = dict(stream_kwargs, show_window=show_window)
+        if frames:
+            self.stream_kwargs["frame_holder"] = self
+        self.stream = None
+        self._loop = None
+        self._future = None
+        self._subs = {name: set() for name in CHANNELS}
+
+        # stream thread -> loop: newest item per channel, one scheduled flush
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    # ---------- lifecycle ----------
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self.stream = EmotionStream(
+            callback=lambda label, conf, probs: self._from_thread(
+                "results", {"label": label, "conf": conf, "probs": probs}),
+            faces_callback=lambda faces: self._from_thread("faces", faces),
+            event_callback=lambda event: self._from_thread("events", event),
+            stats_callback=lambda snap: self._from_thread("stats", snap),
+            **self.stream_kwargs,
+        )
+        # run() blocks until the stream ends, so it lives in the default executor
+        self._future = self._loop.run_in_executor(None, self.stream.run)
+        self._future.add_done_callback(lambda _: self._close_all())
+        return self
+
+    async def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+        if self._future is not None:
+            await self._future
+
+    async def wait(self):
+        """Until the stream ends (camera stopped or stop() called)"""
+        await self._future
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def pause(self):
+        self.stream.pause()
+
+    def resume(self):
+        self.stream.resume()
+
+    def stats(self):
+        return self.stream.stats()
+
+    # ---------- subscriptions ----------
+    def subscribe(self, channel="results"):
+        if channel not in self._subs:
+            raise ValueError(f"Unknown channel: {channel!r}, expected one of {CHANNELS}")
+        sub = Subscription(self, channel, QUEUED_CHANNELS.get(channel, 1))
+        if self._future is not None and self._future.done():
+            sub._close()
+        else:
+            self._subs[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subs[sub.channel].discard(sub)
+        sub._close()
+
+    # ---------- delivery ----------
+    def publish(self, frame, r):
+        """frame_holder hook of EmotionStream (frames=True)"""
+        self._from_thread("frames", (r["seq"], frame))
+
+    def _from_thread(self, channel, item):
+        """Called on pipeline threads: coalesce, then hand over to the loop"""
+        with self._lock:
+            schedule = not self._pending
+            if channel in QUEUED_CHANNELS:
+                self._pending.setdefault(channel, []).append(item)
+            else:
+                self._pending[channel] = item
+        if schedule:
+            try:
+                self._loop.call_soon_threadsafe(self._flush)
+            except RuntimeError:
+                pass   # event loop already closed
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for channel, item in pending.items():
+            items = item if channel in QUEUED_CHANNELS else [item]
+            for sub in self._subs[channel]:
+                for i in items:
+                    sub._put(i)
+
+    def _close_all(self):
+        self._flush()
+        for subs in self._subs.values():
+            for sub in subs:
+                sub._close()
+            subs.clear()
+
+
+async def stream_emotions(channel="events", **stream_kwargs):
+    """
+    Async generator shortcut: one stream, one channel.
+        async for event in stream_emotions("events"):
+            ...
+    """
+    async with AsyncEmotionStream(**stream_kwargs) as stream:
+        sub = stream.subscribe(channel)
+        async for item in sub:
+            yield item
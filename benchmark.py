@@ -0,0 +1,559 @@
+"""
+Emotion Pipeline Benchmarks
+---------------------------
+Headless CPU micro-benchmarks for the real-time emotion detection pipeline.
+Each sub-command measures one part of real_time.py on random or recorded
+inputs and prints a small latency table, so changes to the per-frame hot
+path can be compared before and after.
+
+Usage:
+    python benchmark.py fused --iters 50 --random-weights
+    python benchmark.py backends --onnx-path affectnet_7cls_mouth_full.onnx
+    python benchmark.py startup --backend onnx
+    python benchmark.py precision --faces YOLO_format_cls/valid
+    python benchmark.py beautify --image demo_pic/st_westie_happy.png
+    python benchmark.py preprocess
+    python benchmark.py multiface --max-faces 4
+    python benchmark.py replay --source video:session.mp4 --pacing realtime
+    python benchmark.py stages --source video:session.mp4 --json bench_stages.json
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+
+# =========================
+# 0. Timing helpers
+# =========================
+def time_fn(fn, iters=50, warmup=5):
+    """
+    Call fn() warmup + iters times and return the per-call latencies in ms
+    """
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples
+
+
+def summarize(samples):
+    arr = np.asarray(samples, dtype=np.float64)
+    return {
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "fps": float(1000.0 / arr.mean()) if arr.mean() > 0 else 0.0,
+    }
+
+
+def print_table(rows):
+    print(f"{'case':<28}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'fps':>11}")
+    for name, s in rows:
+        print(f"{name:<28}{s['mean_ms']:>10.2f}{s['p50_ms']:>10.2f}"
+              f"{s['p95_ms']:>10.2f}{s['fps']:>11.1f}")
+
+
+# =========================
+# 1. Fused vs. two-pass model forward
+# =========================
+def bench_fused(args):
+    import torch
+    from fer_model import build_model
+    from real_time import MODEL_PATH, IMG_SIZE
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    checkpoint = None if args.random_weights else MODEL_PATH
+    model = build_model(checkpoint, device="cpu")
+
+    x_full = torch.randn(1, 3, IMG_SIZE, IMG_SIZE)
+    x_mouth = torch.randn(1, 3, IMG_SIZE, IMG_SIZE)
+
+    with torch.no_grad():
+        ref_main, ref_mouth = model(x_full, x_mouth)
+        fused_main, fused_mouth = model.forward_fused(x_full, x_mouth)
+        max_diff = max(
+            (ref_main - fused_main).abs().max().item(),
+            (ref_mouth - fused_mouth).abs().max().item(),
+        )
+
+        two_pass = time_fn(lambda: model(x_full, x_mouth), args.iters, args.warmup)
+        fused = time_fn(lambda: model.forward_fused(x_full, x_mouth), args.iters, args.warmup)
+
+    print(f"torch threads: {torch.get_num_threads()}")
+    print(f"max |logits diff| two-pass vs fused: {max_diff:.2e}")
+    s_two, s_fused = summarize(two_pass), summarize(fused)
+    print_table([("forward (two-pass)", s_two), ("forward_fused (batch of 2)", s_fused)])
+    speedup = s_two['mean_ms'] / s_fused['mean_ms']
+    print(f"speedup: {speedup:.2f}x")
+    print(f'faster here: "forward_mode": "{"fused" if speedup > 1.0 else "two_pass"}" '
+          f'(the default "auto" measures this once and caches it)')
+
+
+# =========================
+# 2. Inference backends (PyTorch vs. ONNX Runtime)
+# =========================
+def bench_backends(args):
+    from fer_model import build_model
+    from real_time import create_backend, MODEL_PATH, IMG_SIZE
+    from inference_backends import TorchBackend
+
+    checkpoint = None if args.random_weights else MODEL_PATH
+    backends = [TorchBackend(build_model(checkpoint, device="cpu"))]
+    onnx = create_backend({"inference_backend": "onnx", "onnx_path": args.onnx_path})
+    if onnx.name == "onnx":
+        backends.append(onnx)
+
+    x_full = np.random.randn(1, 3, IMG_SIZE, IMG_SIZE).astype(np.float32)
+    x_mouth = np.random.randn(1, 3, IMG_SIZE, IMG_SIZE).astype(np.float32)
+
+    rows = []
+    for backend in backends:
+        samples = time_fn(lambda: backend.infer(x_full, x_mouth), args.iters, args.warmup)
+        rows.append((backend.name, summarize(samples)))
+    print_table(rows)
+
+
+# =========================
+# 3. Startup timing
+# =========================
+def bench_startup(args):
+    """
+    Cold-start breakdown as seen by a pet process: importing real_time,
+    importing the inference runtime, loading weights and the first forward.
+    Run in a fresh interpreter for meaningful numbers.
+    """
+    t0 = time.perf_counter()
+    import real_time
+    import_s = time.perf_counter() - t0
+
+    config = real_time.load_inference_config()
+    if args.backend:
+        config["inference_backend"] = args.backend
+    engine = real_time.EmotionEngine(config)
+    engine.load()
+
+    size = real_time.IMG_SIZE
+    x = np.zeros((1, 3, size, size), dtype=np.float32)
+    engine.infer(x, x)
+
+    report = engine.startup_report()
+    report["module_import_s"] = import_s
+    print(f"{'stage':<24}{'seconds':>10}")
+    for key in ("module_import_s", "import_s", "weights_s", "first_inference_s"):
+        print(f"{key[:-2]:<24}{report.get(key, 0.0):>10.3f}")
+    print(f"backend: {report['backend']}")
+
+
+# =========================
+# 4. Precision modes: accuracy vs. latency
+# =========================
+def bench_precision(args):
+    """
+    Top-1 agreement of every precision mode with the fp32 model, plus
+    per-frame latency, on a folder of face crops (random inputs if none).
+    """
+    import copy
+    import torch
+    from fer_model import build_model, apply_precision
+    from inference_backends import TorchBackend
+    from real_time import load_face_crops, softmax_np, MODEL_PATH, MOUTH_ALPHA, IMG_SIZE
+
+    if args.faces:
+        pairs = load_face_crops(args.faces, limit=args.limit)
+    else:
+        print("No --faces folder given, using random inputs (agreement is not meaningful)")
+        rng = np.random.default_rng(0)
+        shape = (1, 3, IMG_SIZE, IMG_SIZE)
+        pairs = [(rng.standard_normal(shape, dtype=np.float32),
+                  rng.standard_normal(shape, dtype=np.float32)) for _ in range(args.limit)]
+    if not pairs:
+        print("No face crops found in", args.faces)
+        return
+
+    calib_dir = args.calib or args.faces
+    calib = None
+    if calib_dir:
+        calib = [torch.from_numpy(np.concatenate(p))
+                 for p in load_face_crops(calib_dir, limit=args.calib_limit)]
+
+    checkpoint = None if args.random_weights else MODEL_PATH
+    fp32_model = build_model(checkpoint, device="cpu")
+
+    def predict(backend):
+        top1 = []
+        for x_full, x_mouth in pairs:
+            logits_main, logits_mouth = backend.infer(x_full, x_mouth)
+            top1.append(int(np.argmax(softmax_np(logits_main + MOUTH_ALPHA * logits_mouth))))
+        return np.asarray(top1)
+
+    reference = predict(TorchBackend(fp32_model, "cpu", "fp32"))
+    x_full, x_mouth = pairs[0]
+
+    print(f"{'mode':<16}{'agree %':>9}{'mean ms':>10}{'p95 ms':>10}{'fps':>11}")
+    for mode in args.modes:
+        model, effective = apply_precision(copy.deepcopy(fp32_model), mode, calib)
+        if effective != mode:
+            print(f"{mode:<16}  skipped (fell back to {effective})")
+            continue
+        backend = TorchBackend(model, "cpu", effective)
+        agree = float((predict(backend) == reference).mean() * 100.0)
+        s = summarize(time_fn(lambda: backend.infer(x_full, x_mouth), args.iters, args.warmup))
+        print(f"{mode:<16}{agree:>9.1f}{s['mean_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['fps']:>11.1f}")
+
+
+# =========================
+# 5. Beautify options
+# =========================
+def bench_beautify(args):
+    """
+    Cost of each beautify option on a 640x360 frame with a typical face box,
+    plus the mean pixel error of the fast approximation.
+    """
+    import cv2
+    from real_time import beautify, beautify_fast, beautify_roi
+
+    if args.image:
+        frame = cv2.resize(cv2.imread(args.image), (640, 360))
+    else:
+        frame = (np.random.default_rng(0).random((360, 640, 3)) * 255).astype(np.uint8)
+    box = (240, 60, 420, 280)   # padded face box, ~180x220
+
+    cases = [
+        ("off", lambda: frame),
+        ("preview (full frame)", lambda: beautify(frame)),
+        ("preview fast", lambda: beautify_fast(frame)),
+        ("roi", lambda: beautify_roi(frame.copy(), box)),
+        ("roi fast", lambda: beautify_roi(frame.copy(), box, beautify_fast)),
+    ]
+    rows = [(name, summarize(time_fn(fn, args.iters, args.warmup))) for name, fn in cases]
+    print_table(rows)
+
+    err = np.abs(beautify(frame).astype(np.int16) - beautify_fast(frame).astype(np.int16)).mean()
+    print(f"fast vs. full mean |pixel diff|: {err:.2f} / 255")
+
+
+# =========================
+# 6. Preprocessing
+# =========================
+def bench_preprocess(args):
+    """
+    Legacy per-crop torch preprocessing vs. numpy pair vs. the preallocated
+    FacePreprocessor, with per-call heap allocation measured by tracemalloc.
+    """
+    import tracemalloc
+    from real_time import (preprocess_full, preprocess_mouth, to_chw_normalized,
+                           crop_mouth_np, FacePreprocessor)
+
+    face = (np.random.default_rng(0).random((220, 180, 3)) * 255).astype(np.uint8)
+    prep = FacePreprocessor()
+
+    cases = [
+        ("preprocess_full+mouth", lambda: (preprocess_full(face), preprocess_mouth(face))),
+        ("to_chw_normalized pair", lambda: (to_chw_normalized(face)[None],
+                                            to_chw_normalized(crop_mouth_np(face))[None])),
+        ("FacePreprocessor", lambda: prep([face])),
+    ]
+
+    rows, alloc_kb = [], []
+    for name, fn in cases:
+        rows.append((name, summarize(time_fn(fn, args.iters, args.warmup))))
+        tracemalloc.start()
+        fn()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        alloc_kb.append((tracemalloc.get_traced_memory()[1] - base) / 1024.0)
+        tracemalloc.stop()
+    print_table(rows)
+
+    print(f"{'case':<28}{'peak alloc KB/call':>20}")
+    for (name, _), kb in zip(rows, alloc_kb):
+        print(f"{name:<28}{kb:>20.1f}")
+
+    x_full, x_mouth = prep([face])
+    diff = max(np.abs(x_full[0] - to_chw_normalized(face)).max(),
+               np.abs(x_mouth[0] - to_chw_normalized(crop_mouth_np(face))).max())
+    print(f"max |diff| vs. reference: {diff:.2e}")
+
+
+# =========================
+# 7. Multi-face batching
+# =========================
+def bench_multiface(args):
+    """
+    One batched forward for N faces vs. N single-face forwards.
+    """
+    from fer_model import build_model
+    from inference_backends import TorchBackend
+    from real_time import create_backend, load_inference_config, MODEL_PATH, IMG_SIZE
+
+    if args.random_weights:
+        backend = TorchBackend(build_model(None, device="cpu"))
+    else:
+        backend = create_backend(load_inference_config())
+
+    print(f"{'faces':<8}{'batched ms':>12}{'sequential ms':>15}{'ms/face':>10}")
+    for n in range(1, args.max_faces + 1):
+        x = np.random.randn(n, 3, IMG_SIZE, IMG_SIZE).astype(np.float32)
+        batched = summarize(time_fn(lambda: backend.infer(x, x), args.iters, args.warmup))
+        sequential = summarize(time_fn(
+            lambda: [backend.infer(x[i:i + 1], x[i:i + 1]) for i in range(n)],
+            args.iters, args.warmup))
+        print(f"{n:<8}{batched['mean_ms']:>12.2f}{sequential['mean_ms']:>15.2f}"
+              f"{batched['mean_ms'] / n:>10.2f}")
+
+
+# =========================
+# 8. Full-pipeline replay
+# =========================
+def bench_replay(args):
+    """
+    Run the complete EmotionStream headless against a recorded or synthetic
+    source and report throughput, CPU time and per-stage latency.
+    """
+    import real_time
+    from frame_sources import open_source
+
+    config = real_time.load_inference_config()
+    if args.random_weights:
+        config["model_path"] = None
+    source = open_source(args.source, pacing=args.pacing)
+    frames = {"read": 0, "results": 0}
+
+    read = source.read
+    def counting_read():
+        ret, frame = read()
+        frames["read"] += ret
+        return ret, frame
+    source.read = counting_read
+
+    def on_emotion(label, conf, probs):
+        frames["results"] += 1
+
+    stream = real_time.EmotionStream(callback=on_emotion, show_window=False,
+                                     config=config, source=source)
+    stream.backend.load()   # keep weight loading out of the measurement
+
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    stream.run()
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+
+    print(f"source: {args.source} ({args.pacing})")
+    print(f"frames read: {frames['read']}, emotion results: {frames['results']}, "
+          f"dropped before inference: {stream.frames.dropped}")
+    print(f"wall {wall:.2f}s, cpu {cpu:.2f}s ({100.0 * cpu / max(wall, 1e-9):.0f}% of one core), "
+          f"{frames['read'] / max(wall, 1e-9):.1f} frames/s")
+    stats = stream.stats()
+    print(f"counters: {stats['counters']}")
+    print(f"  {'stage':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for stage, h in stats["stages"].items():
+        print(f"  {stage:<14}{h['p50_ms']:>9.2f}{h['p95_ms']:>9.2f}{h['p99_ms']:>9.2f}")
+
+
+# =========================
+# 9. Stage-level suite
+# =========================
+def bench_stages(args):
+    """
+    Every per-frame stage of the pipeline measured in isolation on the same
+    frames, with p50/p95/p99 latency and fps. --json writes the results in
+    a machine-readable form so releases can be compared.
+    """
+    import itertools
+    import real_time as rt
+    from frame_sources import open_source
+
+    # ---- frames: preload so source decoding is not measured ----
+    source = open_source(args.source, pacing="fast")
+    frames = []
+    while len(frames) < args.frames:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame)
+    source.release()
+    if not frames:
+        print("No frames from", args.source)
+        return
+    next_frame = itertools.cycle(frames).__next__
+
+    # ---- detectors ----
+    detectors = [("haar", rt.FaceDetector(mode="haar"))]
+    try:
+        detectors.append(("mediapipe", rt.FaceDetector(mode="mediapipe")))
+    except Exception as e:
+        print("MediaPipe not available, skipping. Error:", e)
+
+    # face crop from the first frame with a detection, else a centered box
+    H, W = frames[0].shape[:2]
+    box = (W // 2 - H // 4, H // 4, H // 2, H // 2)
+    for frame in frames:
+        boxes = detectors[-1][1].detect(frame)
+        if boxes:
+            box = max(boxes, key=lambda b: b[2] * b[3])
+            break
+    x, y, w, h = box
+    faces = [f[max(0, y):y + h, max(0, x):x + w] for f in frames]
+    next_face = itertools.cycle(faces).__next__
+
+    # ---- model ----
+    config = rt.load_inference_config()
+    if args.backend:
+        config["inference_backend"] = args.backend
+    if args.random_weights:
+        config["model_path"] = None
+    engine = rt.EmotionEngine(config)
+    engine.load()
+    prep = rt.FacePreprocessor()
+    x_full, x_mouth = prep([faces[0]])
+    x_full, x_mouth = x_full.copy(), x_mouth.copy()
+    logits_main, logits_mouth = engine.infer(x_full, x_mouth)
+    logits = logits_main + rt.MOUTH_ALPHA * logits_mouth
+    ema = {"probs": None}
+
+    def softmax_ema():
+        probs = rt.softmax_np(logits)[0].astype(np.float32)
+        ema["probs"] = rt.smooth_probs(ema["probs"], probs)
+
+    cases = [
+        ("beautify", lambda: rt.beautify(next_frame())),
+        ("beautify_fast", lambda: rt.beautify_fast(next_frame())),
+    ]
+    for name, det in detectors:
+        cases.append((f"detect_{name}", lambda d=det: d.detect(next_frame())))
+        tracker = rt.FaceTracker(det, detect_every=config.get("detect_every", 10))
+        cases.append((f"detect_{name}_tracked", lambda t=tracker: t.detect(next_frame())))
+    cases += [
+        ("preprocess_full+mouth", lambda: (lambda face: (rt.preprocess_full(face),
+                                                         rt.preprocess_mouth(face)))(next_face())),
+        ("preprocess_fused", lambda: prep([next_face()])),
+        (f"forward_{engine.backend.name}", lambda: engine.infer(x_full, x_mouth)),
+        ("softmax_ema", softmax_ema),
+    ]
+
+    results = {}
+    for name, fn in cases:
+        results[name] = summarize(time_fn(fn, args.iters, args.warmup))
+
+    print(f"{'stage':<28}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'fps':>11}")
+    for name, r in results.items():
+        print(f"{name:<28}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['fps']:>11.1f}")
+
+    if args.json:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "platform": platform.platform(),
+                "processor": platform.processor(),
+                "cpu_count": os.cpu_count(),
+                "python": platform.python_version(),
+                "source": args.source,
+                "frame_shape": list(frames[0].shape),
+                "iters": args.iters,
+                "backend": engine.backend.name,
+                "precision": getattr(engine.backend, "precision", None),
+            },
+            "stages": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print("Wrote", args.json)
+
+
+# =========================
+# 10. CLI
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Emotion pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("fused", help="two-pass forward vs. fused batch-of-2 forward")
+    p.add_argument("--iters", type=int, default=50)
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = default)")
+    p.add_argument("--random-weights", action="store_true",
+                   help="skip loading the checkpoint (latency does not depend on weights)")
+    p.set_defaults(func=bench_fused)
+
+    p = sub.add_parser("backends", help="per-frame latency of each inference backend")
+    p.add_argument("--iters", type=int, default=50)
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--onnx-path", default="affectnet_7cls_mouth_full.onnx")
+    p.add_argument("--random-weights", action="store_true")
+    p.set_defaults(func=bench_backends)
+
+    p = sub.add_parser("startup", help="import / weight-load / first-inference breakdown")
+    p.add_argument("--backend", choices=["torch", "onnx"], default=None,
+                   help="override inference_backend from pet_config.json")
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("precision", help="top-1 agreement with fp32 and latency per precision mode")
+    p.add_argument("--faces", default=None, help="folder of face crops to evaluate on")
+    p.add_argument("--calib", default=None, help="calibration folder for int8-static (default: --faces)")
+    p.add_argument("--limit", type=int, default=200, help="max crops to evaluate")
+    p.add_argument("--calib-limit", type=int, default=128)
+    p.add_argument("--modes", nargs="+", default=["fp32", "int8-dynamic", "int8-static", "bf16"])
+    p.add_argument("--iters", type=int, default=30)
+    p.add_argument("--warmup", type=int, default=3)
+    p.add_argument("--random-weights", action="store_true")
+    p.set_defaults(func=bench_precision)
+
+    p = sub.add_parser("beautify", help="cost of each beautify option")
+    p.add_argument("--image", default=None, help="optional frame to use instead of noise")
+    p.add_argument("--iters", type=int, default=50)
+    p.add_argument("--warmup", type=int, default=5)
+    p.set_defaults(func=bench_beautify)
+
+    p = sub.add_parser("preprocess", help="legacy vs. preallocated face/mouth preprocessing")
+    p.add_argument("--iters", type=int, default=200)
+    p.add_argument("--warmup", type=int, default=10)
+    p.set_defaults(func=bench_preprocess)
+
+    p = sub.add_parser("multiface", help="batched vs. sequential inference for N faces")
+    p.add_argument("--max-faces", type=int, default=4)
+    p.add_argument("--iters", type=int, default=20)
+    p.add_argument("--warmup", type=int, default=3)
+    p.add_argument("--random-weights", action="store_true")
+    p.set_defaults(func=bench_multiface)
+
+    p = sub.add_parser("replay", help="run the full pipeline headless on a recorded/synthetic source")
+    p.add_argument("--source", default="synthetic:300",
+                   help="video:PATH, images:DIR or synthetic[:N_FRAMES]")
+    p.add_argument("--pacing", choices=["realtime", "fast"], default="fast",
+                   help="fast: every frame is processed, as fast as possible")
+    p.add_argument("--random-weights", action="store_true")
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser("stages", help="per-stage p50/p95/p99 latency suite with JSON output")
+    p.add_argument("--source", default="synthetic:60",
+                   help="video:PATH, images:DIR or synthetic[:N_FRAMES]")
+    p.add_argument("--frames", type=int, default=60, help="frames to preload from the source")
+    p.add_argument("--iters", type=int, default=100)
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--backend", choices=["torch", "onnx"], default=None)
+    p.add_argument("--random-weights", action="store_true")
+    p.add_argument("--json", default=None, help="write results to this JSON file")
+    p.set_defaults(func=bench_stages)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
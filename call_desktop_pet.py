@@ -23,21 +23,28 @@ def run_pet(state):
     print("[call_desktop_pet] Starting pet...")
 
     import desktop_pet
-    desktop_pet.start_pet(state)
 
     # Turn on a thread to sync position and scale from shared state
+    # (started first: start_pet blocks in the Tk main loop)
     def sync_state():
+        last_pos = None
         while True:
+            if desktop_pet.window is None:
+                time.sleep(0.2)  # pet window not created yet
+                continue
             try:
                 # extract position and scale
                 x = state["x"]
                 y = state["y"]
                 scale = state["scale"]
 
-                # update position
-                desktop_pet.window.geometry(f"+{x}+{y}")
+                # update position only when the controller moved it, so
+                # dragging the pet is not undone; Tk calls go through the Tk thread
+                if (x, y) != last_pos:
+                    last_pos = (x, y)
+                    desktop_pet.window.after(0, lambda g=f"+{x}+{y}": desktop_pet.window.geometry(g))
 
-                # update scale
+                # update scale (polled on the Tk thread by desktop_pet.watch_scale)
                 desktop_pet.scale = scale
 
             except Exception as e:
@@ -45,4 +52,5 @@ def run_pet(state):
 
             time.sleep(0.2)  # sync every 200ms
 
-    threading.Thread(target=sync_state, daemon=True).start()
\ No newline at end of file
+    threading.Thread(target=sync_state, daemon=True).start()
+    desktop_pet.start_pet(state)
\ No newline at end of file
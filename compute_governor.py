@@ -0,0 +1,127 @@
+"""
+Adaptive Compute Governor for the Emotion Stream
+------------------------------------------------
+Keeps the camera/inference pipeline within a CPU budget instead of letting
+it run as fast as the camera delivers. The governor walks a ladder of
+quality levels; each level caps the inference rate, the detector input
+scale and the camera resolution. Once per period it compares the measured
+load with the budget and steps down under load or up when there is
+headroom (with a dead band in between so it does not oscillate).
+
+Load can be measured two ways:
+- "ms_per_s":    pipeline work (detect + preprocess + infer, as measured by
+                 the stage timers) per second of wall time
+- "cpu_percent": process CPU time per wall time (100 = one full core)
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import time
+
+
+# =========================
+# 0. Quality ladder (cheapest first)
+# =========================
+DEFAULT_LEVELS = [
+    # max inferences/s, detector input scale, camera resolution
+    {"max_infer_fps": 1.0,  "detect_scale": 0.5,  "resolution": (320, 180)},
+    {"max_infer_fps": 2.0,  "detect_scale": 0.5,  "resolution": (320, 180)},
+    {"max_infer_fps": 4.0,  "detect_scale": 0.5,  "resolution": (480, 270)},
+    {"max_infer_fps": 6.0,  "detect_scale": 0.75, "resolution": (480, 270)},
+    {"max_infer_fps": 10.0, "detect_scale": 0.75, "resolution": (640, 360)},
+    {"max_infer_fps": 15.0, "detect_scale": 1.0,  "resolution": (640, 360)},
+    {"max_infer_fps": 30.0, "detect_scale": 1.0,  "resolution": (640, 360)},
+]
+
+
+# =========================
+# 1. Governor
+# =========================
+class ComputeGovernor:
+    """
+    Used from the detect/infer thread:
+        wait = gov.time_until_next_infer()   # sleep before taking a frame
+        gov.mark_infer()
+        gov.add_work(stage_ms)               # for every measured stage
+        gov.update()                         # re-evaluates once per period
+    `settings` holds the active level; the capture stage applies the
+    resolution, the infer stage applies the rate and detector scale.
+    """
+    def __init__(self, target="ms_per_s", budget=300.0, period=1.0,
+                 levels=None, start_level=None, step_down_at=1.1, step_up_at=0.7):
+        self.target = target
+        self.budget = float(budget)
+        self.period = period
+        self.levels = levels or DEFAULT_LEVELS
+        self.level = len(self.levels) - 1 if start_level is None else start_level
+        self.step_down_at = step_down_at
+        self.step_up_at = step_up_at
+
+        self.load = 0.0
+        self._work_ms = 0.0
+        self._last_infer = 0.0
+        self._t0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    # ---------- hot path ----------
+    def time_until_next_infer(self, now=None):
+        now = time.perf_counter() if now is None else now
+        interval = 1.0 / self.settings["max_infer_fps"]
+        return max(0.0, self._last_infer + interval - now)
+
+    def mark_infer(self, now=None):
+        self._last_infer = time.perf_counter() if now is None else now
+
+    def add_work(self, ms):
+        self._work_ms += ms
+
+    # ---------- control loop ----------
+    def measure(self, now):
+        elapsed = now - self._t0
+        if self.target == "cpu_percent":
+            cpu = time.process_time()
+            load = 100.0 * (cpu - self._cpu0) / elapsed
+            self._cpu0 = cpu
+        else:
+            load = self._work_ms / elapsed
+        self._work_ms = 0.0
+        self._t0 = now
+        return load
+
+    def update(self, now=None):
+        """
+        Re-evaluate the level once per period. Returns True if it changed.
+        """
+        now = time.perf_counter() if now is None else now
+        if now - self._t0 < self.period:
+            return False
+
+        self.load = self.measure(now)
+        old = self.level
+        if self.load > self.budget * self.step_down_at and self.level > 0:
+            self.level -= 1
+        elif self.load < self.budget * self.step_up_at and self.level < len(self.levels) - 1:
+            self.level += 1
+
+        if self.level != old:
+            print(f"[governor] load {self.load:.0f} / {self.budget:.0f} {self.target}: "
+                  f"level {old} -> {self.level} {self.settings}")
+            return True
+        return False
+
+    def snapshot(self):
+        return {
+            "target": self.target,
+            "budget": self.budget,
+            "load": self.load,
+            "level": self.level,
+            "max_infer_fps": self.settings["max_infer_fps"],
+            "detect_scale": self.settings["detect_scale"],
+            "resolution": list(self.settings["resolution"]),
+        }
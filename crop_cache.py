@@ -0,0 +1,94 @@
+"""
+Perceptual-Hash Cache for Face Crops
+------------------------------------
+Skips the model call when a face crop has not visibly changed since the
+last inference for that face. Each crop is reduced to two 64-bit difference
+hashes (dHash), one of the whole face and one of the mouth region, so small
+mouth movements still count as a change. If both hashes are within a few
+bits of the cached ones, the previous probabilities are returned instead
+of running the model.
+
+Entries expire after `max_age` seconds, so even a perfectly still face is
+re-classified regularly and results never go stale.
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+# =========================
+# 1. Difference hash
+# =========================
+def dhash(img_bgr):
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail"""
+    small = cv2.resize(img_bgr, (9, 8), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+# =========================
+# 2. Per-face cache
+# =========================
+class CropCache:
+    """
+    face id -> (face hash, mouth hash, probs, time of the inference).
+    Used from the detect/infer thread only.
+    """
+    def __init__(self, threshold=4, max_age=1.0):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0   # estimated preprocess + model time not spent, minus hashing
+
+    def key(self, face_bgr, mouth_bgr):
+        return dhash(face_bgr), dhash(mouth_bgr)
+
+    def lookup(self, face_id, key, now=None):
+        """Cached probabilities for this face if the crop is unchanged, else None"""
+        entry = self.entries.get(face_id)
+        if entry is None:
+            return None
+        face_h, mouth_h, probs, t = entry
+        now = time.perf_counter() if now is None else now
+        if (now - t > self.max_age
+                or hamming(face_h, key[0]) > self.threshold
+                or hamming(mouth_h, key[1]) > self.threshold):
+            return None
+        return probs
+
+    def store(self, face_id, key, probs, now=None):
+        now = time.perf_counter() if now is None else now
+        self.entries[face_id] = (key[0], key[1], probs, now)
+
+    def record(self, hits, misses, ms_per_face=0.0, hash_ms=0.0):
+        self.hits += hits
+        self.misses += misses
+        self.saved_ms += hits * ms_per_face - hash_ms
+
+    def prune(self, live_ids):
+        for face_id in list(self.entries):
+            if face_id not in live_ids:
+                del self.entries[face_id]
+
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_ms": self.saved_ms,
+        }
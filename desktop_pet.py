@@ -12,12 +12,19 @@ Date: December 2025
 
 """
 
-import random
+import os
 import tkinter as tk
 import time
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
-from real_time import start_emotion_stream
+from frame_cache import load_frames
+from frame_store import FrameStore
+from animation_scheduler import AnimationPlayer
+from real_time import start_emotion_stream, get_engine, load_inference_config
+from shm_stream import EmotionProcess
+from emotion_client import EmotionClient
 
 # ============================
 # 0. Preset dog messages
@@ -33,6 +40,13 @@ dog_loop_thread = None
 stop_dog_loop = True
 window = None
 label = None
+emotion_stream = None   # EmotionStream / EmotionProcess / EmotionClient handle (pause / resume / stop)
+scale = 1.0             # user scale, set live by call_desktop_pet.sync_state
+pet_factor = 1.0        # per-pet size correction (the tom / panda GIFs are large)
+MAX_SCALE_VARIANTS = 3  # AnimationLoaders kept for recently used scales
+player = None           # AnimationPlayer: per-frame timing of the pet GIFs
+CROSSFADE_MS = 240      # emotion change without a transition clip
+CROSSFADE_STEPS = 4
 
 
 def dog_message_loop():
@@ -65,6 +79,10 @@ def switch_to_dog_mode():
     current_mode = "dog"
     stop_dog_loop = False
 
+    # the dog mode does not use the camera: release it and stop inference
+    if emotion_stream is not None:
+        emotion_stream.pause()
+
     if dog_loop_thread is None or not dog_loop_thread.is_alive():
         dog_loop_thread = threading.Thread(target=dog_message_loop, daemon=True)
         dog_loop_thread.start()
@@ -77,16 +95,28 @@ def switch_to_face_mode():
     current_mode = "face"
     stop_dog_loop = True
 
+    if emotion_stream is not None:
+        emotion_stream.resume()
+
 
 # ============================
 # 1. Main function to start the desktop pet
 # ============================
 def start_pet(shared_state):
-    global state, window, label, scale
-    global ANIMATIONS, neutral_frames
+    global state, window, label, scale, pet_factor
+    global animations, emotion_stream, gif_paths, decode_pool, player
     state = shared_state
     pet_type = state.get("pet_type", "westie")
 
+    # camera + model in a shared emotion server, a separate process
+    # (shared-memory results) or a thread here
+    cfg = load_inference_config()
+    server = cfg.get("emotion_server")
+    use_process = cfg.get("inference_process")
+    if not server and not use_process:
+        # load the emotion model in the background while the window is built
+        get_engine().load_async()
+
     # ============================
     # 1.1 Determine GIF path
     # ============================
@@ -110,6 +140,7 @@ def start_pet(shared_state):
     window.config(bg='black')
     window.bind("1", lambda e: switch_to_dog_mode())
     window.bind("2", lambda e: switch_to_face_mode())
+    window.bind("m", lambda e: memory_report())
 
     # ============================
     # 1.3 Make window draggable
@@ -135,42 +166,55 @@ def start_pet(shared_state):
     # 1.5 Load emotion animations
     # ============================
     scale = float(state.get("scale", 1.0))
-    if pet_type == "tom":
-        scale *= 0.4
-    if pet_type == "panda":
-        scale *= 0.5
-    happy_frames    = load_gif_scaled(gif_path + f"happy_{pet_type}.gif", scale)
-    sad_frames      = load_gif_scaled(gif_path + f"sad_{pet_type}.gif", scale)
-    angry_frames    = load_gif_scaled(gif_path + f"angry_{pet_type}.gif", scale)
-    surprise_frames = load_gif_scaled(gif_path + f"surprise_{pet_type}.gif", scale)
-    neutral_frames  = load_gif_scaled(gif_path + f"neutral_{pet_type}.gif", scale)
-    ANIMATIONS = {
-        "Happiness": happy_frames,
-        "Sadness":   sad_frames,
-        "Anger":     angry_frames,
-        "Surprise":  surprise_frames,
-        "Neutral":   neutral_frames,
+    pet_factor = {"tom": 0.4, "panda": 0.5}.get(pet_type, 1.0)
+    names = {
+        "Happiness": "happy",
+        "Sadness":   "sad",
+        "Anger":     "angry",
+        "Surprise":  "surprise",
+        "Neutral":   "neutral",
     }
+    gif_paths = {emotion: gif_path + f"{name}_{pet_type}.gif" for emotion, name in names.items()}
+    # optional transition clips, e.g. neutral_to_happy_westie.gif (cross-fade otherwise)
+    for a, name_a in names.items():
+        for b, name_b in names.items():
+            path = gif_path + f"{name_a}_to_{name_b}_{pet_type}.gif"
+            if a != b and os.path.exists(path):
+                gif_paths[f"{a}->{b}"] = path
+    # decoded on worker threads: neutral right away, the others when first shown
+    decode_pool = ThreadPoolExecutor(max_workers=2)
+    animations = get_scale_variant(round(scale * pet_factor, 3))
+    animations.request("Neutral")
     # ============================
     # 1.6 Start emotion stream thread
     # ============================
-    threading.Thread(
-        target=start_emotion_stream,
-        kwargs={
-            "callback": on_emotion_from_camera,
-            "show_window": True,
-            "frame_holder": state,        # save frames
-            "state": state                # save state
-        },
-        daemon=True
-    ).start()
+    if server:
+        # emotion_server.py owns the camera; only change events come over the socket
+        emotion_stream = EmotionClient(server).start(on_emotion_event)
+    elif use_process:
+        # frames and results come back through shared memory, not the Manager dict
+        emotion_stream = EmotionProcess(state=state, show_window=True).start()
+        window.after(200, poll_emotion_process)
+    else:
+        emotion_stream = start_emotion_stream(
+            event_callback=on_emotion_event,   # fires on emotion changes only
+            show_window=True,
+            frame_holder=state,        # save frames
+            state=state,               # save state
+            background=True,           # returns a pause / resume / stop handle
+        )
 
     # ============================
     # 1.7 Start applying emotion to pet and animation loop
     # ============================
     window.after(2000, apply_emotion_to_pet)
-    window.after(2000, update, 0)
-    window.mainloop()
+    player = AnimationPlayer(show_frame, window.after, window.after_cancel)
+    window.after(0, update)         # show neutral right away, model keeps loading
+    window.after(200, watch_scale)
+    try:
+        window.mainloop()
+    finally:
+        emotion_stream.stop()
 
 
 # ============================
@@ -190,40 +234,232 @@ EMOTION_MAP = {
 }
 
 # ============================
-# 3. Helper function: GIF frame cycling
+# 3. Helper function: GIF decoding
 # ============================
-def gif_work(cycle, frames, event_number, first_num, last_num):
-    """Cycle through frames and switch to next event when one animation ends"""
-    print("[desktop_pet] gif_work is running")
-    if cycle < len(frames) - 1:
-        cycle += 1
-    else:
-        cycle = 0
-        event_number = random.randrange(first_num, last_num + 1, 1)
-    return cycle, event_number
-
-
-def load_gif_scaled(path, scale=1.0):
+def decode_to_store(path, scale, store):
+    """
+    Decode (or map from the frame cache) a scaled GIF into a FrameStore on a
+    worker thread. Returns (frame keys, durations in ms).
+    """
     print(f"[desktop_pet] Loading scaled GIF from {path}, scale={scale}")
-    frames = []
+    frames, durations = load_frames(path, scale)
+    return [store.add(frame) for frame in frames], durations
 
-    img = Image.open(path)
 
+class AnimationLoader:
+    """
+    Loads the emotion animations without blocking the Tk thread.
+    GIFs are decoded and scaled on a small thread pool, only when an
+    emotion is first requested, into a compact, deduplicated FrameStore.
+    PhotoImages are made on the Tk thread (Tk is not thread-safe) a few per
+    tick, so the animation keeps playing while a new one is prepared, and
+    only for the `active` most recently shown animations: the one on
+    screen and the one being switched from / to. Identical frames share
+    one PhotoImage.
+    """
+    def __init__(self, window, paths, scale, workers=2, chunk=4, pool=None, active=2):
+        self.window = window
+        self.paths = paths
+        self.scale = scale
+        self.chunk = chunk
+        self.active = active
+        self.pool = pool or ThreadPoolExecutor(max_workers=workers)
+        self.store = FrameStore()
+        self.futures = {}          # emotion -> Future[(frame keys, durations)]
+        self.clips = {}            # emotion -> frame keys, once decoded
+        self.durations = {}        # emotion -> frame durations in ms
+        self.frames = OrderedDict()  # emotion -> list of PhotoImage, active emotions only
+        self.photos = {}           # frame key -> PhotoImage, shared by the active emotions
+        self._wanted = []          # emotions waiting for their PhotoImages
+        self._building = {}        # emotion -> PhotoImages made so far
+        self._pumping = False
+        self.closed = False
+
+    def request(self, emotion):
+        """Decode an emotion's GIF and make its PhotoImages (Tk thread, no-op if already under way)"""
+        if self.closed or emotion not in self.paths:
+            return
+        if emotion not in self.futures:
+            self.futures[emotion] = self.pool.submit(
+                decode_to_store, self.paths[emotion], self.scale, self.store)
+        if emotion not in self.frames and emotion not in self._wanted:
+            self._wanted.append(emotion)
+        if not self._pumping:
+            self._pumping = True
+            self.window.after(10, self._pump)
+
+    def get(self, emotion):
+        """PhotoImages of an emotion, or None while they are being made"""
+        frames = self.frames.get(emotion)
+        if frames is None:
+            self.request(emotion)
+        else:
+            self.frames.move_to_end(emotion)
+        return frames
+
+    def ready(self, emotions):
+        """True once every emotion in `emotions` has its PhotoImages (requests the rest)"""
+        return all(self.get(e) is not None for e in emotions)
+
+    def image(self, emotion, index):
+        """PIL frame of a decoded emotion (from the store, no Tk), or None"""
+        keys = self.clips.get(emotion)
+        return self.store.image(keys[index % len(keys)]) if keys else None
+
+    def release_photos(self):
+        """Drop every PhotoImage (the scale is no longer on screen); the compact store stays"""
+        self.frames.clear()
+        self.photos = {}
+        self._building = {}
+        self._wanted = []
+
+    def close(self):
+        """Drop queued decodes; the PhotoImages go away with the loader"""
+        self.closed = True
+        for future in self.futures.values():
+            future.cancel()
+
+    def _release(self):
+        """Keep PhotoImages only for the `active` most recently used emotions"""
+        while len(self.frames) > self.active:
+            self.frames.popitem(last=False)
+        needed = set()
+        for emotion in list(self.frames) + list(self._building):
+            needed.update(self.clips.get(emotion, ()))
+        self.photos = {k: p for k, p in self.photos.items() if k in needed}
+
+    def _pump(self):
+        if self.closed:
+            self._pumping = False
+            return
+        for emotion in list(self._wanted):
+            future = self.futures[emotion]
+            if not future.done():
+                continue
+            if emotion not in self.clips:
+                try:
+                    self.clips[emotion], self.durations[emotion] = future.result()
+                except Exception as e:
+                    print(f"[desktop_pet] Failed to load {self.paths[emotion]}: {e}")
+                    self.clips[emotion], self.durations[emotion] = [], []
+
+            keys = self.clips[emotion]
+            built = self._building.setdefault(emotion, [])
+            for key in keys[len(built):len(built) + self.chunk]:
+                photo = self.photos.get(key)
+                if photo is None:
+                    photo = self.photos[key] = ImageTk.PhotoImage(self.store.image(key))
+                built.append(photo)
+            if len(built) == len(keys):
+                self.frames[emotion] = self._building.pop(emotion)
+                self._wanted.remove(emotion)
+                self._release()
+            break   # one chunk per tick keeps the Tk thread responsive
+
+        if self._wanted:
+            self.window.after(10, self._pump)
+        else:
+            self._pumping = False
+
+    def memory(self):
+        """Frame memory of this scale: compact store + the PhotoImages alive now"""
+        report = self.store.report()
+        report["photo_images"] = len(self.photos)
+        report["photo_bytes"] = sum(self.store.photo_bytes(k) for k in self.photos)
+        report["active"] = list(self.frames)
+        return report
+
+
+# scale -> AnimationLoader, least recently used first
+animation_variants = OrderedDict()
+
+
+def get_scale_variant(pet_scale):
+    """
+    AnimationLoader for one pet scale (Tk thread). Loaders share the decode
+    pool and the frame cache, and only the MAX_SCALE_VARIANTS most recently
+    used are kept; the one on screen is never evicted. Only the loader on
+    screen and the requested one hold PhotoImages, the others keep just
+    their compact FrameStore.
+    """
+    loader = animation_variants.get(pet_scale)
+    if loader is None:
+        loader = AnimationLoader(window, gif_paths, pet_scale, pool=decode_pool)
+        animation_variants[pet_scale] = loader
+    current = globals().get("animations")
+    for other in animation_variants.values():
+        if other is not loader and other is not current:
+            other.release_photos()   # e.g. a size the slider only passed through
+    if current is not None:
+        animation_variants.move_to_end(current.scale)
+    animation_variants.move_to_end(pet_scale)
+    while len(animation_variants) > MAX_SCALE_VARIANTS:
+        _, old = animation_variants.popitem(last=False)
+        old.close()
+    return loader
+
+
+_scale_seen = None
+
+def watch_scale():
+    """
+    Follow `scale` (set by the controller) without blocking the animation:
+    the frames for the new size are prepared in the background, and the pet
+    switches to them in one step once neutral and the current emotion are
+    ready. Until then the old size keeps playing.
+    """
+    global animations, _scale_seen
     try:
-        while True:
-            frame = img.copy().convert("RGBA")
-
-            w, h = frame.size
-            frame = frame.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
-
-            frames.append(ImageTk.PhotoImage(frame))
-
-            img.seek(img.tell() + 1)
-
-    except EOFError:
+        target = round(float(scale) * pet_factor, 3)
+    except (TypeError, ValueError):
+        target = animations.scale
+
+    # wait for the slider to settle for one tick before starting a variant
+    if target > 0 and target != animations.scale and target == _scale_seen:
+        loader = get_scale_variant(target)
+        if loader.ready(("Neutral", current_pet_emotion)):
+            print(f"[desktop_pet] Rescaled pet {animations.scale} -> {target}")
+            previous, animations = animations, loader
+            update()
+            previous.release_photos()   # the player has switched to the new frames
+    _scale_seen = target
+    window.after(200, watch_scale)
+
+
+def _rss_bytes():
+    """Resident memory of this process, or None if it cannot be read"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
         pass
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
 
-    return frames
+def memory_report(verbose=True):
+    """
+    Frame memory of every loaded scale (press "m" on the pet): frames as
+    full RGBA PhotoImages (what one PhotoImage per frame used to cost) vs.
+    the compact store plus the PhotoImages that exist now.
+    """
+    mb = 1024 * 1024
+    reports = {scale: loader.memory() for scale, loader in animation_variants.items()}
+    if verbose:
+        for scale, r in reports.items():
+            print(f"[desktop_pet] Frames at scale {scale}: {r['frames']} frames, "
+                  f"{r['unique']} unique ({r['palette_frames']} palette) | "
+                  f"as PhotoImages {r['raw_bytes'] / mb:.1f} MB -> "
+                  f"store {r['stored_bytes'] / mb:.1f} MB + "
+                  f"{r['photo_images']} PhotoImages {r['photo_bytes'] / mb:.1f} MB "
+                  f"(active: {', '.join(r['active']) or '-'})")
+        rss = _rss_bytes()
+        if rss is not None:
+            print(f"[desktop_pet] Process resident memory: {rss / mb:.1f} MB")
+    return reports
 
 
 # ============================
@@ -357,10 +593,36 @@ def on_emotion_from_camera(label, conf, probs):
     # print("[desktop_pet] on_emotion_from_camera is called")
     # print(f"[Callback] Detected {label} (conf={conf:.2f})")
     global current_emotion_label, current_pet_emotion
+    previous = current_pet_emotion
     current_emotion_label = label
     current_pet_emotion = EMOTION_MAP.get(label, "Neutral")
+    if window is not None and current_pet_emotion != previous:
+        window.after(0, update)   # the player does not tick on static frames
     # print(f"[Callback] Detected {label} (conf={conf:.2f}), pet emotion = {current_pet_emotion}")
 
+
+def on_emotion_event(event):
+    """
+    event callback from real_time.py: called only when the emotion changes
+    (see emotion_events.py), instead of on every frame
+    """
+    if event["type"] == "changed" and event["label"] != "No face":
+        on_emotion_from_camera(event["label"], event["conf"], None)
+
+_last_event_count = 0
+
+def poll_emotion_process():
+    """
+    EmotionProcess mode: read the shared-memory result slot (no IPC) and
+    forward new emotion change events
+    """
+    global _last_event_count
+    r = emotion_stream.latest_result()
+    if r["event_count"] != _last_event_count:
+        _last_event_count = r["event_count"]
+        on_emotion_event({"type": "changed", "label": r["event_label"], "conf": r["conf"]})
+    window.after(200, poll_emotion_process)
+
 # ============================
 # 7. Apply emotion to pet
 # ============================
@@ -381,26 +643,70 @@ def apply_emotion_to_pet():
 # ============================
 # 8. Main animation loop
 # ============================
-def update(cycle=0):
-    """
-    play the GIF animation based on current emotion
-    """
-    global ANIMATIONS, neutral_frames, current_pet_emotion
-    print("[desktop_pet] update is running")
-    global label
+_update_job = None
 
-    frames = ANIMATIONS.get(current_pet_emotion, neutral_frames)
-    if not frames:
-        window.after(100, update, 0)
-        return
 
-    frame = frames[cycle % len(frames)]
+def show_frame(frame):
     label.configure(image=frame)
-    label.config(bg='black')
 
-    # next cycle
-    next_cycle = (cycle + 1) % len(frames)
-    window.after(100, update, next_cycle)   # 200ms per frame
 
+def crossfade(src, dst, steps=CROSSFADE_STEPS, ms=CROSSFADE_MS):
+    """(PhotoImages, durations) blending PIL frame src into dst, or None"""
+    if src.size != dst.size:
+        return None
+    src, dst = src.convert("RGBA"), dst.convert("RGBA")
+    frames = [ImageTk.PhotoImage(Image.blend(src, dst, (i + 1) / (steps + 1)))
+              for i in range(steps)]
+    return frames, [ms // steps] * steps
 
 
+def make_transition(old_key, new_key):
+    """
+    Transition into a new emotion: its transition clip when the pet has one
+    (and it is loaded), otherwise a short cross-fade from the frame on
+    screen. None (a plain cut) on start-up and when the scale changes.
+    """
+    if old_key is None or old_key[0] != new_key[0] or player.in_transition:
+        return None
+    old, new = old_key[1], new_key[1]
+    clip = animations.get(f"{old}->{new}")
+    if clip:
+        return clip, animations.durations[f"{old}->{new}"]
+    if player.index < 0:
+        return None
+    src, dst = animations.image(old, player.source_index), animations.image(new, 0)
+    if src is None or dst is None:
+        return None
+    return crossfade(src, dst)
+
+
+def update():
+    """
+    Hand the animation of the current emotion to the player, which shows
+    every frame for its own GIF duration. Called on emotion and scale
+    changes, and every 100 ms only while an animation is still loading.
+    """
+    global _update_job
+    if _update_job is not None:
+        window.after_cancel(_update_job)
+        _update_job = None
+
+    emotion = current_pet_emotion
+    frames = animations.get(emotion)
+    if frames is None:
+        _update_job = window.after(100, update)
+        if player.key is not None:
+            return      # keep playing the current animation until it is ready
+    if not frames:
+        # an emotion that is still loading (or failed) shows neutral meanwhile
+        emotion = "Neutral"
+        frames = animations.get(emotion)
+        if not frames:
+            if _update_job is None:
+                _update_job = window.after(100, update)
+            return
+
+    key = (animations.scale, emotion)
+    if key != player.key:
+        player.play(key, frames, animations.durations[emotion],
+                    transition=make_transition(player.key, key))
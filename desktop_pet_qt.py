@@ -9,9 +9,10 @@ from PySide6.QtWidgets import (
     QLabel,
 )
 from PySide6.QtGui import QMovie, QFont
-from PySide6.QtCore import Qt, QTimer, QPoint, QSize
+from PySide6.QtCore import Qt, QTimer, QPoint, QSize, Signal
 
-from real_time import start_emotion_stream
+from real_time import start_emotion_stream, get_engine
+from emotion_client import EmotionClient, server_address_from_config
 
 print("[desktop_pet] desktop_pet.py (PySide6 version) is running")
 
@@ -81,6 +82,9 @@ def load_config():
 # ============================
 
 class DesktopPet(QWidget):
+    # emitted from the camera thread, delivered on the UI thread (queued connection)
+    emotion_changed = Signal(str)
+
     def __init__(self, scale=0.5, enable_emotion=True):
         super().__init__()
 
@@ -135,10 +139,8 @@ class DesktopPet(QWidget):
         # Initially use Neutral animation
         self.set_emotion("Neutral")
 
-        # Periodically check for facial expression changes (using variables shared with the camera thread)
-        self.emotion_poll_timer = QTimer(self)
-        self.emotion_poll_timer.timeout.connect(self.poll_emotion_state)
-        self.emotion_poll_timer.start(200)
+        # Facial expression changes arrive as events from the camera thread (no polling)
+        self.emotion_changed.connect(self.on_emotion_changed)
 
         # Scheduled Pop-up Bubble
         self.bubble_timer = QTimer(self)
@@ -199,18 +201,27 @@ Note: This only updates Python variables and does not directly manipulate the Qt
         pet_emotion = EMOTION_MAP.get(label_text, "Neutral")
         current_pet_emotion = pet_emotion
 
-        # Keep one copy on the instance (polled by the UI thread)
+        # Keep one copy on the instance
         self.current_pet_emotion = pet_emotion
 
-    def poll_emotion_state(self):
+    def on_emotion_event(self, event):
+        """
+        Event callback of real_time.start_emotion_stream, called in the camera
+        thread only when the emotion changes. Hands the label to the UI thread.
+        """
+        if event["type"] == "changed" and event["label"] != "No face":
+            self.emotion_changed.emit(event["label"])
+
+    def on_emotion_changed(self, label_text):
         """
-        The UI thread checks for changes in pet_emotion every 200ms. If it has changed, it switches the animation
-        and simultaneously updates the text label in the top-left corner.
+        UI thread: switch the animation and update the text label in the top-left corner.
         """
-        if self.current_pet_emotion != self.active_emotion:
-            self.set_emotion(self.current_pet_emotion)
+        global current_emotion_label, current_pet_emotion
+        current_emotion_label = label_text
+        current_pet_emotion = EMOTION_MAP.get(label_text, "Neutral")
+        self.current_pet_emotion = current_pet_emotion
 
-        # Update text labels
+        self.set_emotion(self.current_pet_emotion)
         self.emotion_label_widget.setText(current_emotion_label)
 
     # Calculate bubble position (follow dog)
@@ -343,11 +354,18 @@ def main():
     pet = DesktopPet(scale=scale, enable_emotion=enable_emotion)
 
     # Launch the camera emotion detection thread
-    if enable_emotion:
+    # (the model loads in the background; the pet shows Neutral meanwhile)
+    server = server_address_from_config()
+    if enable_emotion and server:
+        # emotion_server.py owns the camera and the model; just follow its events
+        EmotionClient(server).start(pet.on_emotion_event)
+        print(f"[desktop_pet] Following emotion server at {server}")
+    elif enable_emotion:
+        get_engine().load_async()
         th = threading.Thread(
             target=start_emotion_stream,
             kwargs={
-                "callback": pet.on_emotion_from_camera,
+                "event_callback": pet.on_emotion_event,
                 "show_window": False,
             },
             daemon=True
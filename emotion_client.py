@@ -0,0 +1,161 @@
+"""
+Emotion Server Client
+---------------------
+Tiny client for emotion_server.py, using only the standard library, so
+the pets and the Streamlit panel can follow the shared camera stream
+without importing torch / OpenCV.
+
+    client = EmotionClient(channels=("events",))
+    client.start(on_message)          # background thread, reconnects
+    ...
+    client.latest["changed"]          # last message of each type
+
+    for msg in EmotionClient(channels=("results",)):   # blocking iteration
+        print(msg["label"], msg["conf"])
+
+    snap = fetch_latest(channels=("events", "preview"))  # one-shot, e.g. Streamlit
+    snap["preview"]["jpeg"]                              # JPEG bytes
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+DEFAULT_ADDRESS = "tcp://127.0.0.1:8765"
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pet_config.json")
+
+
+def parse_address(address):
+    """'tcp://host:port' / 'host:port' -> ("tcp", (host, port)); 'unix:///path' -> ("unix", path)"""
+    if address.startswith("unix://"):
+        return "unix", address[len("unix://"):]
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def server_address_from_config(path=CONFIG_PATH):
+    """The "emotion_server" address from pet_config.json, or None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("emotion_server")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class EmotionClient:
+    def __init__(self, address=DEFAULT_ADDRESS, channels=("events",), timeout=5.0):
+        self.address = address
+        self.channels = list(channels)
+        self.timeout = timeout
+        self.latest = {}       # message type -> last message
+        self.paused = False    # while paused, start() callbacks are skipped
+        self._sock = None
+        self._file = None
+        self._closed = False
+        self._thread = None
+
+    # ---------- connection ----------
+    def connect(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(target)
+        sock.settimeout(None)
+        sock.sendall((json.dumps({"subscribe": self.channels}) + "\n").encode("utf-8"))
+        self._sock = sock
+        self._file = sock.makefile("rb")
+        return self
+
+    def receive(self):
+        """Next message (dict), or None when the server closed the connection"""
+        line = self._file.readline()
+        if not line:
+            return None
+        msg = json.loads(line)
+        if msg.get("type") == "preview":
+            msg["jpeg"] = self._file.read(msg["size"])
+        self.latest[msg.get("type")] = msg
+        return msg
+
+    def __iter__(self):
+        if self._sock is None:
+            self.connect()
+        while True:
+            msg = self.receive()
+            if msg is None:
+                return
+            yield msg
+
+    def close(self):
+        self._closed = True
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+
+    # ---------- background thread ----------
+    def start(self, callback=None, retry_s=2.0):
+        """Read messages on a daemon thread; reconnects until close()"""
+        def loop():
+            while not self._closed:
+                try:
+                    self.connect()
+                    for msg in self:
+                        if callback is not None and not self.paused:
+                            callback(msg)
+                except (OSError, ValueError) as e:
+                    if not self._closed:
+                        print(f"[emotion_client] {self.address}: {e}, retrying")
+                if not self._closed:
+                    time.sleep(retry_s)
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        return self
+
+    # same handle interface as EmotionStream; the shared camera keeps running
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        self.close()
+
+
+def fetch_latest(address=DEFAULT_ADDRESS, channels=("events",), timeout=2.0):
+    """
+    Connect, wait (up to `timeout`) for one message of every requested
+    channel and return {message type: message}. Handy for polling UIs.
+    """
+    wanted = {"events": ("changed", "snapshot"), "results": ("result",),
+              "stats": ("stats",), "preview": ("preview",)}
+    client = EmotionClient(address, channels, timeout)
+    try:
+        client.connect()
+        client._sock.settimeout(timeout)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(any(t in client.latest for t in wanted[c]) for c in channels):
+                break
+            if client.receive() is None:
+                break
+    except (OSError, ValueError):
+        pass
+    finally:
+        client.close()
+    return client.latest
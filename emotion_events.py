@@ -0,0 +1,88 @@
+"""
+Emotion Change Events
+---------------------
+Turns the per-frame output of the emotion stream into a sparse stream of
+discrete events, so consumers (desktop pets, shared state, UIs) are only
+woken up when the emotion actually changes.
+
+A hysteresis state machine decides when the emotion has changed:
+- the new label must reach `min_conf`
+- it must beat the current label's probability by `margin`
+- it must stay on top for `confirm_s` seconds in a row
+- the current label must have been held for at least `min_dwell_s`
+
+Events are plain dicts:
+    {"type": "changed",  "label": "Happy", "previous": "Neutral", "conf": 0.81, "t": ...}
+    {"type": "snapshot", "label": "Happy", "conf": 0.78, "probs": [...], "t": ...}
+Snapshots are optional and sent every `snapshot_interval` seconds.
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import time
+
+NO_FACE = "No face"
+
+
+class EmotionEvents:
+    def __init__(self, labels, min_conf=0.5, margin=0.1, confirm_s=0.3,
+                 min_dwell_s=1.0, snapshot_interval=0.0):
+        self.index = {name: i for i, name in enumerate(labels)}
+        self.min_conf = min_conf
+        self.margin = margin
+        self.confirm_s = confirm_s
+        self.min_dwell_s = min_dwell_s
+        self.snapshot_interval = snapshot_interval
+
+        self.label = None          # confirmed emotion (None until the first event)
+        self.conf = 0.0
+        self.since = 0.0           # when the confirmed emotion was entered
+        self.candidate = None
+        self.candidate_since = 0.0
+        self._last_snapshot = 0.0
+        self.changes = 0
+
+    def _beats_current(self, label, conf, probs):
+        if conf < self.min_conf:
+            return False
+        if probs is None or label == NO_FACE or self.label not in self.index:
+            return True
+        return probs[self.index[label]] - probs[self.index[self.label]] >= self.margin
+
+    def update(self, label, conf, probs, now=None):
+        """
+        Feed one frame result (label=None means no face). Returns the list of
+        events it produced, usually empty.
+        """
+        now = time.perf_counter() if now is None else now
+        if label is None:
+            label, conf, probs = NO_FACE, 1.0, None
+        events = []
+
+        if label == self.label or not self._beats_current(label, conf, probs):
+            self.candidate = None
+        else:
+            if label != self.candidate:
+                self.candidate = label
+                self.candidate_since = now
+            if (now - self.candidate_since >= self.confirm_s
+                    and (self.label is None or now - self.since >= self.min_dwell_s)):
+                events.append({"type": "changed", "label": label, "previous": self.label,
+                               "conf": float(conf), "t": time.time()})
+                self.label = label
+                self.since = now
+                self.candidate = None
+                self.changes += 1
+
+        if label == self.label:
+            self.conf = float(conf)
+
+        if (self.snapshot_interval and self.label is not None
+                and now - self._last_snapshot >= self.snapshot_interval):
+            self._last_snapshot = now
+            events.append({"type": "snapshot", "label": self.label, "conf": self.conf,
+                           "probs": None if probs is None else [float(p) for p in probs],
+                           "t": time.time()})
+        return events
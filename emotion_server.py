@@ -0,0 +1,220 @@
+"""
+Local Emotion Server
+--------------------
+One process owns the camera and the model and broadcasts compact emotion
+messages to any number of local clients (the Tk pet, the Qt pet, the
+Streamlit panel), over localhost TCP or a Unix socket. Clients only need
+emotion_client.py (standard library only), so they never import torch or
+OpenCV and never open the camera themselves.
+
+Protocol (newline-delimited JSON):
+- the client may send one line first:
+      {"subscribe": ["events", "results", "stats", "preview"]}
+  (default: ["events"])
+- the server then sends one JSON object per line, e.g.
+      {"type": "changed", "label": "Happy", "previous": "Neutral", "conf": 0.81, "t": ...}
+      {"type": "result", "label": "Happy", "conf": 0.77, "probs": [...]}
+  Preview frames are a header line followed by the raw JPEG bytes:
+      {"type": "preview", "seq": 812, "size": 23110}\n<23110 bytes>
+The latest "changed" event is replayed to new clients so they start in
+sync. Results, stats and previews are latest-value-wins: a slow client
+skips stale messages instead of slowing the camera or other clients.
+Events are queued per client (see async_stream.QUEUED_CHANNELS), so a
+snapshot never hides a change event.
+
+Usage:
+    python emotion_server.py                               # tcp://127.0.0.1:8765
+    python emotion_server.py --address unix:///tmp/pet.sock --preview-fps 5
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import cv2
+
+from async_stream import AsyncEmotionStream, Subscription
+from emotion_client import DEFAULT_ADDRESS, parse_address
+
+SERVER_CHANNELS = ("events", "results", "stats", "preview")
+
+
+def _round_probs(probs):
+    return None if probs is None else [round(float(p), 4) for p in probs]
+
+
+def encode_message(msg):
+    return (json.dumps(msg, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+# =========================
+# 1. Server
+# =========================
+class EmotionServer:
+    """
+    Keyword arguments go to real_time.EmotionStream (config, source, ...).
+    preview_fps=0 disables JPEG previews entirely (no encoding cost).
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, preview_fps=5.0, jpeg_quality=70,
+                 **stream_kwargs):
+        self.address = address
+        self.preview_fps = preview_fps
+        self.jpeg_quality = jpeg_quality
+        self.stream = AsyncEmotionStream(frames=preview_fps > 0, **stream_kwargs)
+        self.last_change = None
+        self.clients = 0
+        self._preview_subs = set()
+        self._handlers = {}     # client handler task -> its writer
+
+    # preview hub (Subscription expects hub.unsubscribe)
+    def unsubscribe(self, sub):
+        self._preview_subs.discard(sub)
+        sub._close()
+
+    async def _track_changes(self):
+        async for event in self.stream.subscribe("events"):
+            if event["type"] == "changed":
+                self.last_change = event
+
+    async def _encode_previews(self):
+        """One JPEG per preview interval, shared by every preview client"""
+        loop = asyncio.get_running_loop()
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(self.jpeg_quality)]
+        interval = 1.0 / self.preview_fps
+        next_t = 0.0
+        async for seq, frame in self.stream.subscribe("frames"):
+            now = time.perf_counter()
+            if not self._preview_subs or now < next_t:
+                continue
+            next_t = now + interval
+            ok, buf = await loop.run_in_executor(None, cv2.imencode, ".jpg", frame, params)
+            if ok:
+                item = (seq, buf.tobytes())
+                for sub in self._preview_subs:
+                    sub._put(item)
+
+    # ---------- one client ----------
+    async def _send_channel(self, writer, channel, sub):
+        async for item in sub:
+            if channel == "preview":
+                seq, jpeg = item
+                writer.write(encode_message({"type": "preview", "seq": seq, "size": len(jpeg)}) + jpeg)
+            elif channel == "results":
+                writer.write(encode_message({"type": "result", "label": item["label"],
+                                             "conf": round(float(item["conf"]), 4),
+                                             "probs": _round_probs(item["probs"])}))
+            elif channel == "stats":
+                writer.write(encode_message(dict(item, type="stats")))
+            else:
+                writer.write(encode_message(item))
+            await writer.drain()
+
+    async def _handle_client(self, reader, writer):
+        task = asyncio.current_task()
+        self._handlers[task] = writer
+        try:
+            await self._serve_client(reader, writer)
+        except asyncio.CancelledError:
+            # serve() is shutting down; end normally, as asyncio's stream
+            # server logs a traceback for a cancelled handler task
+            pass
+        finally:
+            self._handlers.pop(task, None)
+
+    async def _serve_client(self, reader, writer):
+        channels = ["events"]
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout=1.0)
+            if line.strip():
+                channels = [c for c in json.loads(line).get("subscribe", channels)
+                            if c in SERVER_CHANNELS]
+        except (asyncio.TimeoutError, ValueError, AttributeError):
+            pass
+
+        subs = {}
+        for channel in channels:
+            if channel == "preview":
+                if self.preview_fps > 0:
+                    sub = Subscription(self, "preview")
+                    self._preview_subs.add(sub)
+                    subs[channel] = sub
+            else:
+                subs[channel] = self.stream.subscribe(channel)
+
+        self.clients += 1
+        print(f"[emotion_server] client connected ({self.clients}), channels: {list(subs)}")
+        tasks = []
+        try:
+            if "events" in subs and self.last_change is not None:
+                writer.write(encode_message(self.last_change))
+            tasks = [asyncio.create_task(self._send_channel(writer, c, s)) for c, s in subs.items()]
+            # a client closing its socket shows up as EOF on the reader
+            tasks.append(asyncio.create_task(reader.read()))
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for sub in subs.values():
+                sub.close()
+            self.clients -= 1
+            print(f"[emotion_server] client disconnected ({self.clients})")
+            writer.close()
+
+    # ---------- run ----------
+    async def serve(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            server = await asyncio.start_unix_server(self._handle_client, path=target)
+        else:
+            server = await asyncio.start_server(self._handle_client, *target)
+        print(f"[emotion_server] Listening on {self.address}")
+
+        await self.stream.start()
+        helpers = [asyncio.create_task(self._track_changes())]
+        if self.preview_fps > 0:
+            helpers.append(asyncio.create_task(self._encode_previews()))
+        try:
+            async with server:
+                await self.stream.wait()   # until the camera stops
+        finally:
+            await self.stream.stop()
+            # connected clients: close them and wait for their handlers,
+            # so none is left cancelled-but-unawaited at loop shutdown
+            handlers = list(self._handlers.items())
+            for task, writer in handlers:
+                writer.close()
+                task.cancel()
+            for t in helpers:
+                t.cancel()
+            await asyncio.gather(*helpers, *(t for t, _ in handlers), return_exceptions=True)
+
+
+# =========================
+# 2. CLI
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="Local emotion pub/sub server")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS,
+                        help="tcp://host:port or unix:///path/to.sock")
+    parser.add_argument("--preview-fps", type=float, default=5.0,
+                        help="JPEG preview rate for clients that ask for it (0 = off)")
+    parser.add_argument("--jpeg-quality", type=int, default=70)
+    args = parser.parse_args()
+
+    server = EmotionServer(args.address, args.preview_fps, args.jpeg_quality)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+FER-7 Model Definition
+----------------------
+PyTorch definition of the dual-head FER-7 classifier (EfficientNet-B0
+backbone + full-face head + mouth head) used by the real-time pipeline.
+It lives in its own module so that importing real_time does not pull in
+torch/torchvision; the PyTorch backend imports it only when the model is
+actually built.
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import torch
+from torch import nn
+from torchvision.models import efficientnet_b0
+
+
+# =========================
+# 0. Device selection
+# =========================
+def select_device():
+    return "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# ===============================================
+# 1. Define the model architecture same as training
+# ===============================================
+class FER7WithMouth(nn.Module):
+    """
+    EfficientNet-B0 backbone + dual heads (full face + mouth)
+    """
+    def __init__(self, backbone, num_classes=7):
+        super().__init__()
+        self.backbone = backbone  #
+
+        # Main head: full face
+        self.head_main = nn.Sequential(
+            nn.Linear(1280, 256),
+            nn.ReLU(),
+            nn.Dropout(0.3),
+            nn.Linear(256, num_classes)
+        )
+
+        # Secondary head: mouth only
+        self.head_mouth = nn.Sequential(
+            nn.Linear(1280, 128),
+            nn.ReLU(),
+            nn.Dropout(0.3),
+            nn.Linear(128, num_classes)
+        )
+
+    def forward(self, x_full, x_mouth):
+        feat_full = self.backbone(x_full)    # [B, 1280]
+        feat_mouth = self.backbone(x_mouth)  # [B, 1280]
+
+        logits_main = self.head_main(feat_full)
+        logits_mouth = self.head_mouth(feat_mouth)
+        return logits_main, logits_mouth
+
+    def forward_main(self, x_full):
+        feat_full = self.backbone(x_full)
+        return self.head_main(feat_full)
+
+    def forward_mouth(self, x_mouth):
+        feat_mouth = self.backbone(x_mouth)
+        return self.head_mouth(feat_mouth)
+
+    def forward_fused(self, x_full, x_mouth):
+        """
+        Same outputs as forward(), but the full and mouth crops are stacked
+        into one batch so the backbone runs a single pass instead of two.
+        BatchNorm is frozen in eval mode, so every row is still independent.
+        """
+        B = x_full.shape[0]
+        feats = self.backbone(torch.cat([x_full, x_mouth], dim=0))  # [2B, 1280]
+
+        logits_main = self.head_main(feats[:B])
+        logits_mouth = self.head_mouth(feats[B:])
+        return logits_main, logits_mouth
+
+
+def build_model(checkpoint_path, device="cpu"):
+    """
+    Construct FER7WithMouth and load weights.
+    checkpoint_path=None keeps random weights (enough for latency benchmarks).
+    """
+    # construct backbone
+    base = efficientnet_b0(weights=None)
+    base.classifier = nn.Identity()
+
+    # construct full model
+    model = FER7WithMouth(base, num_classes=7).to(device)
+
+    # load weights
+    if checkpoint_path is not None:
+        state = torch.load(checkpoint_path, map_location=device)
+        model.load_state_dict(state, strict=True)
+        print("Loaded model from", checkpoint_path)
+    model.eval()
+    return model
+
+
+# =========================
+# 2. Reduced-precision CPU inference
+# =========================
+PRECISION_MODES = ("fp32", "int8-dynamic", "int8-static", "bf16")
+
+
+def bf16_supported():
+    """True if the CPU has native bf16 kernels (AVX512-BF16 / AMX) via oneDNN"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def quantize_dynamic_heads(model):
+    """
+    INT8 dynamic quantization of the Linear layers. The backbone classifier is
+    Identity and EfficientNet's SE blocks are convolutions, so this only
+    touches head_main / head_mouth.
+    """
+    from torch.ao.quantization import quantize_dynamic
+    return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static_backbone(model, calib_batches, backend="x86"):
+    """
+    FX graph mode static INT8 quantization of the backbone.
+    calib_batches: iterable of float32 tensors [B,3,224,224] (real face
+    crops, full and mouth) used to observe activation ranges.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = backend
+    example = (torch.zeros(1, 3, 224, 224),)
+    prepared = prepare_fx(model.backbone, get_default_qconfig_mapping(backend), example)
+
+    n = 0
+    with torch.no_grad():
+        for x in calib_batches:
+            prepared(x)
+            n += x.shape[0]
+    print(f"Calibrated INT8 backbone on {n} crops")
+
+    model.backbone = convert_fx(prepared)
+    return model
+
+
+def apply_precision(model, mode="fp32", calib_batches=None):
+    """
+    Convert an fp32 CPU model to the requested precision mode.
+    Returns (model, effective_mode): unsupported modes fall back instead of
+    failing, in the same spirit as the MediaPipe -> Haar fallback.
+    - int8-dynamic: INT8 heads, fp32 backbone
+    - int8-static:  INT8 backbone (needs calibration crops) + INT8 heads
+    - bf16:         fp32 weights, bf16 autocast at inference time
+    """
+    if mode not in PRECISION_MODES:
+        print(f"Unknown precision '{mode}', using fp32")
+        return model, "fp32"
+
+    if mode == "bf16" and not bf16_supported():
+        print("CPU has no native bf16 support, using fp32")
+        return model, "fp32"
+
+    if mode == "int8-static":
+        if calib_batches is None:
+            print("No calibration crops for int8-static, using int8-dynamic")
+            mode = "int8-dynamic"
+        else:
+            model = quantize_static_backbone(model, calib_batches)
+
+    if mode in ("int8-dynamic", "int8-static"):
+        model = quantize_dynamic_heads(model)
+
+    return model, mode
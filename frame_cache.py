@@ -0,0 +1,209 @@
+"""
+On-Disk Cache of Pre-Scaled Pet Frames
+--------------------------------------
+Decoding a GIF and LANCZOS-resizing every frame is the slowest part of
+starting the desktop pet, and it produces the same pixels every time. This
+module stores the result once per (file, mtime, size, scale, filter) as a
+plain uint8 .npy array [N,H,W,4] (RGBA) that is memory-mapped on the next
+start, plus a small JSON file with the per-frame durations.
+
+The cache is capped in size: the least recently used entries are removed
+first (every hit refreshes the entry's mtime). Several decode workers may
+store at once, so eviction is serialised and tolerates entries that
+vanish while it runs.
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".frame_cache")
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# full-resolution decodes are kept (and other scales derived from them) only
+# up to this size; the 970x720 tom / panda GIFs are ~210 MB each as RGBA
+MAX_FULL_RES_BYTES = 64 * 1024 * 1024
+
+RESAMPLE = {
+    "lanczos": Image.LANCZOS,
+    "bicubic": Image.BICUBIC,
+    "bilinear": Image.BILINEAR,
+    "nearest": Image.NEAREST,
+}
+
+
+# =========================
+# 1. Decoding
+# =========================
+def decode_gif(path, scale=1.0, resample="lanczos"):
+    """
+    Every frame of a GIF as RGBA, resized by `scale`.
+    Returns (frames uint8 [N,H,W,4], durations in ms).
+    """
+    img = Image.open(path)
+    frames, durations = [], []
+    try:
+        while True:
+            frame = img.copy().convert("RGBA")
+            if scale != 1.0:
+                w, h = frame.size
+                frame = frame.resize((max(1, int(w * scale)), max(1, int(h * scale))),
+                                     RESAMPLE[resample])
+            frames.append(np.asarray(frame))
+            durations.append(int(img.info.get("duration") or 100))
+            img.seek(img.tell() + 1)
+    except EOFError:
+        pass
+    return np.stack(frames), durations
+
+
+def full_res_bytes(path):
+    """Size of a GIF's full-resolution RGBA decode"""
+    with Image.open(path) as img:
+        w, h = img.size
+        return w * h * 4 * getattr(img, "n_frames", 1)
+
+
+def scale_frames(frames, scale, resample="lanczos"):
+    """Resize already decoded RGBA frames [N,H,W,4] by `scale`"""
+    _, h, w, _ = frames.shape
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    return np.stack([
+        np.asarray(Image.fromarray(np.asarray(f), "RGBA").resize(size, RESAMPLE[resample]))
+        for f in frames
+    ])
+
+
+# =========================
+# 2. Cache
+# =========================
+class FrameCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+
+    def key(self, path, scale, resample):
+        st = os.stat(path)
+        raw = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{scale:.4f}|{resample}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".npy", base + ".json"
+
+    def load(self, key):
+        """(memory-mapped frames, durations) or None"""
+        npy, meta = self._paths(key)
+        if not (os.path.exists(npy) and os.path.exists(meta)):
+            return None
+        try:
+            frames = np.load(npy, mmap_mode="r")
+            with open(meta, "r", encoding="utf-8") as f:
+                durations = json.load(f)["durations"]
+            os.utime(npy)   # LRU: mark as recently used
+            return frames, durations
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[frame_cache] Dropping unreadable entry {key}: {e}")
+            self._remove(key)
+            return None
+
+    def store(self, key, frames, durations, source=""):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        npy, meta = self._paths(key)
+        try:
+            # write-then-rename so a reader never maps a half-written file
+            tmp = npy + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(frames, dtype=np.uint8))
+            os.replace(tmp, npy)
+            with open(meta + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"source": source, "shape": list(frames.shape),
+                           "durations": durations}, f)
+            os.replace(meta + ".tmp", meta)
+        except OSError as e:
+            print("[frame_cache] Failed to write cache entry:", e)
+            return
+        self.evict()
+
+    def _remove(self, key):
+        for p in self._paths(key):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes"""
+        with self._evict_lock:
+            entries = []
+            for e in self._scan():
+                if not e.name.endswith(".npy"):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue    # removed since the scan
+                entries.append((st.st_mtime, st.st_size, e.name[:-4]))
+            entries.sort(reverse=True)
+            total = 0
+            for _, size, key in entries:
+                total += size
+                if total > self.max_bytes:
+                    self._remove(key)
+
+    def _scan(self):
+        try:
+            return list(os.scandir(self.cache_dir))
+        except OSError:
+            return []
+
+    def size(self):
+        total = 0
+        for e in self._scan():
+            try:
+                total += e.stat().st_size
+            except OSError:
+                pass
+        return total
+
+
+_default_cache = None
+
+
+def get_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = FrameCache()
+    return _default_cache
+
+
+def load_frames(path, scale=1.0, resample="lanczos", cache=None):
+    """
+    Scaled RGBA frames of a GIF and their durations, from the disk cache
+    when possible (the array is then memory-mapped and read-only). New
+    scales are resized from the cached full-resolution decode when the GIF
+    is small enough to keep one (MAX_FULL_RES_BYTES), so rescaling does not
+    decode the GIF again; larger GIFs are decoded straight to the new scale.
+    """
+    cache = cache or get_cache()
+    key = cache.key(path, scale, resample)
+    hit = cache.load(key)
+    if hit is not None:
+        return hit
+    if scale == 1.0:
+        frames, durations = decode_gif(path)
+    elif full_res_bytes(path) <= MAX_FULL_RES_BYTES:
+        full, durations = load_frames(path, 1.0, resample, cache)
+        frames = scale_frames(full, scale, resample)
+    else:
+        frames, durations = decode_gif(path, scale, resample)
+    cache.store(key, frames, durations, source=path)
+    return frames, durations
@@ -0,0 +1,284 @@
+"""
+Frame Sources for the Emotion Pipeline
+--------------------------------------
+Interchangeable frame producers for real_time.EmotionStream. Every source
+follows the small subset of the cv2.VideoCapture API that the capture stage
+uses (isOpened / read / release), so the same pipeline runs against a live
+camera, a recorded video, a folder of images or a synthetic generator.
+
+Non-camera sources can be paced in real time (frames are released at their
+nominal fps, like a camera) or as fast as possible (for benchmarking), and
+replay deterministically, which lets latency and CPU regressions be
+reproduced on machines without a camera.
+
+Source specs accepted by open_source():
+    0, "camera:0"          live camera by index
+    "video:session.mp4"    video file
+    "images:frames_dir"    directory of images, sorted by name
+    "synthetic"            generated frames with a moving face-like blob
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+# =========================
+# 0. Pacing
+# =========================
+class Pacer:
+    """
+    Releases frames at a fixed rate against a monotonic clock.
+    pacing="realtime" sleeps until each frame's deadline (late frames are
+    not delayed further); pacing="fast" never sleeps.
+    """
+    def __init__(self, fps=30.0, pacing="realtime"):
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self.realtime = pacing == "realtime"
+        self._next = None
+
+    def wait(self):
+        if not self.realtime or self.interval == 0.0:
+            return
+        now = time.monotonic()
+        if self._next is None:
+            self._next = now
+        delay = self._next - now
+        if delay > 0:
+            time.sleep(delay)
+        # never accumulate more than one interval of lag
+        self._next = max(self._next, now - self.interval) + self.interval
+
+
+# =========================
+# 1. Sources
+# =========================
+class FrameSource:
+    name = "base"
+    # True when every frame must be processed (a recording replayed with
+    # pacing="fast"): the stream then blocks capture instead of dropping
+    lossless = False
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        """Returns (ok, frame_bgr) like cv2.VideoCapture.read"""
+        raise NotImplementedError
+
+    def suspend(self):
+        """Free the device while the stream is paused (no-op for most sources)"""
+        pass
+
+    def resume(self):
+        """Reacquire the device after suspend(); returns False if that failed"""
+        return True
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    name = "camera"
+
+    def __init__(self, index=0, width=640, height=360):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.cap = None
+        self._open()
+
+    def _open(self):
+        self.cap = cv2.VideoCapture(self.index)
+        self.cap.set(3, self.width)    # width
+        self.cap.set(4, self.height)   # height
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)   # no driver-side frame backlog
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        return self.cap.read()
+
+    def set_resolution(self, width, height):
+        """Ask the driver for a new capture size (used by the compute governor)"""
+        self.width, self.height = width, height
+        self.cap.set(3, width)
+        self.cap.set(4, height)
+
+    def suspend(self):
+        # releasing the device turns the camera (and its LED) off
+        self.cap.release()
+
+    def resume(self):
+        self._open()
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    name = "video"
+
+    def __init__(self, path, pacing="realtime", loop=False, fps=None):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        self.loop = loop
+        fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.pacer = Pacer(fps, pacing)
+        self.lossless = pacing == "fast"
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if ret:
+            self.pacer.wait()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    name = "images"
+
+    def __init__(self, folder, fps=30.0, pacing="realtime", loop=False):
+        exts = (".jpg", ".jpeg", ".png", ".bmp")
+        self.paths = sorted(
+            os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(exts)
+        )
+        self.loop = loop
+        self.idx = 0
+        self.pacer = Pacer(fps, pacing)
+        self.lossless = pacing == "fast"
+
+    def isOpened(self):
+        return len(self.paths) > 0
+
+    def read(self):
+        while True:
+            if self.idx >= len(self.paths):
+                if not self.loop or not self.paths:
+                    return False, None
+                self.idx = 0
+            frame = cv2.imread(self.paths[self.idx])
+            self.idx += 1
+            if frame is not None:
+                self.pacer.wait()
+                return True, frame
+
+
+class SyntheticSource(FrameSource):
+    """
+    Deterministic generated frames: noisy background plus a skin-toned
+    ellipse with eyes and mouth that drifts slowly, so detectors and
+    trackers have something face-like to follow.
+    """
+    name = "synthetic"
+
+    def __init__(self, width=640, height=360, fps=30.0, n_frames=None,
+                 pacing="realtime", seed=0):
+        self.width = width
+        self.height = height
+        self.n_frames = n_frames
+        self.pacer = Pacer(fps, pacing)
+        self.lossless = pacing == "fast"
+        self.rng = np.random.default_rng(seed)
+        self.background = (self.rng.random((height, width, 3)) * 60 + 40).astype(np.uint8)
+        self.count = 0
+
+    def read(self):
+        if self.n_frames is not None and self.count >= self.n_frames:
+            return False, None
+
+        t = self.count / 30.0
+        frame = self.background.copy()
+        cx = int(self.width * (0.5 + 0.15 * np.sin(t * 0.7)))
+        cy = int(self.height * (0.5 + 0.08 * np.sin(t * 1.1)))
+        r = int(self.height * 0.22)
+
+        cv2.ellipse(frame, (cx, cy), (int(r * 0.8), r), 0, 0, 360, (140, 170, 215), -1)
+        for dx in (-0.3, 0.3):
+            cv2.circle(frame, (int(cx + dx * r), int(cy - 0.25 * r)), max(2, r // 10), (40, 40, 40), -1)
+        mouth_h = max(2, int(r * (0.08 + 0.06 * (1 + np.sin(t * 2.0)))))
+        cv2.ellipse(frame, (cx, int(cy + 0.45 * r)), (int(r * 0.35), mouth_h), 0, 0, 360, (60, 60, 150), -1)
+
+        self.count += 1
+        self.pacer.wait()
+        return True, frame
+
+
+class RecordingSource(FrameSource):
+    """
+    Wraps another source and writes every frame it delivers to a video
+    file, so a live session can be replayed later with VideoFileSource.
+    """
+    def __init__(self, source, path, fps=30.0):
+        self.source = source
+        self.name = source.name
+        self.path = path
+        self.fps = fps
+        self.writer = None
+
+    @property
+    def lossless(self):
+        return self.source.lossless
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def read(self):
+        ret, frame = self.source.read()
+        if ret:
+            if self.writer is None:
+                h, w = frame.shape[:2]
+                fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+                self.writer = cv2.VideoWriter(self.path, fourcc, self.fps, (w, h))
+            self.writer.write(frame)
+        return ret, frame
+
+    def suspend(self):
+        self.source.suspend()
+
+    def resume(self):
+        return self.source.resume()
+
+    def release(self):
+        self.source.release()
+        if self.writer is not None:
+            self.writer.release()
+
+
+# =========================
+# 2. Factory
+# =========================
+def open_source(spec=0, pacing="realtime", loop=False, width=640, height=360):
+    """
+    Build a frame source from a spec (see module docstring).
+    """
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CameraSource(int(spec), width, height)
+
+    kind, _, arg = str(spec).partition(":")
+    if kind == "camera":
+        return CameraSource(int(arg or 0), width, height)
+    if kind == "video":
+        return VideoFileSource(arg, pacing=pacing, loop=loop)
+    if kind == "images":
+        return ImageDirSource(arg, pacing=pacing, loop=loop)
+    if kind == "synthetic":
+        n_frames = int(arg) if arg else None
+        return SyntheticSource(width, height, n_frames=n_frames, pacing=pacing)
+    raise ValueError(f"Unknown frame source: {spec!r}")
@@ -0,0 +1,122 @@
+"""
+Compact Pet Frame Store
+-----------------------
+In-memory store for the decoded pet frames. Every frame is hashed, so
+identical frames (repeated poses, shared between emotions) are kept once,
+and each unique frame is kept in a compact form:
+- palette indices (1 byte per pixel) + palette, when an opaque frame has
+  at most 256 colours (lossless, e.g. the westie GIFs),
+- RGB (or RGBA if the frame is not opaque) otherwise,
+both zlib-compressed. A frame is turned back into a PIL image only when a
+PhotoImage has to be made from it, which takes well under a millisecond.
+
+The store is thread-safe: frames are added from the decode workers.
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import hashlib
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+ZLIB_LEVEL = 1      # ~10x smaller than raw RGB already, and fast
+
+
+# =========================
+# 1. Compact frames
+# =========================
+class PackedFrame:
+    __slots__ = ("mode", "size", "data", "palette")
+
+    def __init__(self, mode, size, data, palette=None):
+        self.mode = mode          # "P", "RGB" or "RGBA"
+        self.size = size          # (width, height)
+        self.data = data          # zlib-compressed pixels
+        self.palette = palette    # RGB palette bytes for "P"
+
+    @property
+    def nbytes(self):
+        return len(self.data) + len(self.palette or b"")
+
+
+def pack_frame(frame, level=ZLIB_LEVEL):
+    """RGBA uint8 [H,W,4] -> PackedFrame"""
+    h, w, _ = frame.shape
+    if not (frame[..., 3] == 255).all():
+        return PackedFrame("RGBA", (w, h), zlib.compress(np.ascontiguousarray(frame).tobytes(), level))
+
+    rgb = frame[..., :3].astype(np.uint32)
+    colours, indices = np.unique((rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2],
+                                 return_inverse=True)
+    if len(colours) <= 256:
+        palette = np.stack([colours >> 16, (colours >> 8) & 255, colours & 255], axis=1)
+        return PackedFrame("P", (w, h),
+                           zlib.compress(indices.astype(np.uint8).tobytes(), level),
+                           palette.astype(np.uint8).tobytes())
+    return PackedFrame("RGB", (w, h),
+                       zlib.compress(np.ascontiguousarray(frame[..., :3]).tobytes(), level))
+
+
+def unpack_frame(packed):
+    """PackedFrame -> PIL image (RGB or RGBA)"""
+    img = Image.frombytes(packed.mode, packed.size, zlib.decompress(packed.data))
+    if packed.mode == "P":
+        img.putpalette(packed.palette)
+        img = img.convert("RGB")
+    return img
+
+
+# =========================
+# 2. Store
+# =========================
+class FrameStore:
+    def __init__(self, level=ZLIB_LEVEL):
+        self.level = level
+        self.frames = {}        # frame hash -> PackedFrame
+        self.added = 0          # frames added, duplicates included
+        self.raw_bytes = 0      # what they take as plain RGBA arrays
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(frame):
+        frame = np.ascontiguousarray(frame)
+        h = hashlib.blake2b(frame.data, digest_size=16)
+        h.update(str(frame.shape).encode("ascii"))
+        return h.hexdigest()
+
+    def add(self, frame):
+        """Store an RGBA frame [H,W,4]; returns its key (the same for identical frames)"""
+        key = self.key(frame)
+        with self._lock:
+            self.added += 1
+            self.raw_bytes += frame.nbytes
+            if key in self.frames:
+                return key
+        packed = pack_frame(frame, self.level)
+        with self._lock:
+            self.frames.setdefault(key, packed)
+        return key
+
+    def image(self, key):
+        return unpack_frame(self.frames[key])
+
+    def photo_bytes(self, key):
+        """Memory of a Tk PhotoImage of this frame (Tk keeps 4 bytes per pixel)"""
+        w, h = self.frames[key].size
+        return w * h * 4
+
+    def report(self):
+        with self._lock:
+            frames = list(self.frames.values())
+            return {
+                "frames": self.added,
+                "unique": len(frames),
+                "palette_frames": sum(f.mode == "P" for f in frames),
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": sum(f.nbytes for f in frames),
+            }
@@ -0,0 +1,189 @@
+"""
+Inference Backends for the FER-7 Model
+--------------------------------------
+This module hides the model call of the real-time emotion pipeline behind a
+small backend interface. Every backend takes two float32 numpy batches
+(full face and mouth ROI, [B,3,224,224]) and returns the main and mouth
+logits as float32 numpy arrays ([B,7]).
+
+Backends:
+- TorchBackend: eager PyTorch, fused or two-pass backbone forward
+                (picked per machine with forward_mode="auto"),
+                fp32, INT8 or bf16 (see fer_model.apply_precision)
+- OnnxBackend:  ONNX Runtime on the CPU execution provider, using the
+                model exported by selfsuper_train.ipynb
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import time
+
+import numpy as np
+
+
+# =========================
+# 1. Backend interface
+# =========================
+class InferenceBackend:
+    name = "base"
+    supports_main_only = False   # True if infer_main() / infer_mouth() run one branch each
+
+    def infer(self, x_full, x_mouth):
+        """
+        x_full, x_mouth: np.float32 [B,3,H,W]
+        returns (logits_main, logits_mouth): np.float32 [B,num_classes]
+        """
+        raise NotImplementedError
+
+    def infer_main(self, x_full):
+        """
+        Cheap path: full-face head only (one backbone pass instead of two)
+        returns logits_main: np.float32 [B,num_classes]
+        """
+        raise NotImplementedError
+
+    def infer_mouth(self, x_mouth):
+        """
+        Mouth head only, to complete the fusion of faces whose infer_main()
+        logits are already known
+        returns logits_mouth: np.float32 [B,num_classes]
+        """
+        raise NotImplementedError
+
+
+# =========================
+# 2. PyTorch backend
+# =========================
+class TorchBackend(InferenceBackend):
+    name = "torch"
+    supports_main_only = True
+
+    def __init__(self, model, device="cpu", precision="fp32", forward_mode="fused"):
+        import torch
+        self.torch = torch
+        self.model = model
+        self.device = device
+        self.precision = precision   # see fer_model.apply_precision
+        # "fused" (one batch-of-2N backbone pass) or "two_pass"; which one is
+        # faster depends on the CPU, see select_forward()
+        self.forward_mode = forward_mode
+
+    def select_forward(self, img_size, batch_sizes=(1,), rounds=8, warmup=2, margin=0.1):
+        """
+        forward_mode="auto": time both forwards on this machine for the
+        batch sizes the stream will run and keep the faster one. The two
+        modes are interleaved (alternating which goes first) so drift in
+        CPU clock or load affects both alike, and fused stays unless
+        two-pass is at least `margin` faster, so noise cannot flip it.
+        Returns {"two_pass_ms", "fused_ms"}: summed medians over batch sizes.
+        """
+        modes = ("fused", "two_pass")
+        inputs = [np.zeros((b, 3, img_size, img_size), dtype=np.float32) for b in batch_sizes]
+        times = {(m, i): [] for m in modes for i in range(len(inputs))}
+        for r in range(warmup + rounds):
+            order = modes if r % 2 == 0 else modes[::-1]
+            for i, x in enumerate(inputs):
+                for mode in order:
+                    self.forward_mode = mode
+                    t0 = time.perf_counter()
+                    self.infer(x, x)
+                    if r >= warmup:
+                        times[(mode, i)].append(time.perf_counter() - t0)
+
+        ms = {m + "_ms": sum(sorted(times[(m, i)])[rounds // 2] * 1000.0
+                             for i in range(len(inputs))) for m in modes}
+        self.forward_mode = ("two_pass" if ms["two_pass_ms"] < ms["fused_ms"] * (1.0 - margin)
+                             else "fused")
+        return ms
+
+    def infer(self, x_full, x_mouth):
+        torch = self.torch
+        # from_numpy shares memory with the numpy batch (no copy on CPU)
+        t_full = torch.from_numpy(x_full).to(self.device)
+        t_mouth = torch.from_numpy(x_mouth).to(self.device)
+
+        with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16,
+                                             enabled=self.precision == "bf16"):
+            if self.forward_mode == "fused":
+                logits_main, logits_mouth = self.model.forward_fused(t_full, t_mouth)
+            else:
+                logits_main, logits_mouth = self.model(t_full, t_mouth)
+        return logits_main.float().cpu().numpy(), logits_mouth.float().cpu().numpy()
+
+    def infer_main(self, x_full):
+        torch = self.torch
+        t_full = torch.from_numpy(x_full).to(self.device)
+        with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16,
+                                             enabled=self.precision == "bf16"):
+            logits_main = self.model.forward_main(t_full)
+        return logits_main.float().cpu().numpy()
+
+    def infer_mouth(self, x_mouth):
+        torch = self.torch
+        t_mouth = torch.from_numpy(x_mouth).to(self.device)
+        with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16,
+                                             enabled=self.precision == "bf16"):
+            logits_mouth = self.model.forward_mouth(t_mouth)
+        return logits_mouth.float().cpu().numpy()
+
+
+# =========================
+# 3. ONNX Runtime backend
+# =========================
+class OnnxBackend(InferenceBackend):
+    """
+    Input/output names follow the export cell in selfsuper_train.ipynb:
+    full_input, mouth_input -> main_logits, mouth_logits (dynamic batch axis).
+
+    Inputs and outputs are bound through IOBinding, so ONNX Runtime reads the
+    numpy batches in place and writes logits straight into preallocated
+    arrays. The returned arrays are reused by the next infer() call with the
+    same batch size; copy them if they must outlive that call.
+
+    The exported graph always takes both inputs, so there is no main-only path.
+    """
+    name = "onnx"
+
+    def __init__(self, onnx_path, intra_threads=0):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_threads:
+            opts.intra_op_num_threads = intra_threads
+
+        self.session = ort.InferenceSession(
+            onnx_path,
+            sess_options=opts,
+            providers=["CPUExecutionProvider"],
+        )
+        self.num_classes = self.session.get_outputs()[0].shape[1]
+        self.binding = self.session.io_binding()
+        self._outputs = {}   # batch size -> (main_logits, mouth_logits)
+        print("Loaded ONNX model from", onnx_path)
+
+    def _output_buffers(self, batch):
+        outs = self._outputs.get(batch)
+        if outs is None:
+            outs = (
+                np.empty((batch, self.num_classes), dtype=np.float32),
+                np.empty((batch, self.num_classes), dtype=np.float32),
+            )
+            self._outputs[batch] = outs
+        return outs
+
+    def infer(self, x_full, x_mouth):
+        x_full = np.ascontiguousarray(x_full, dtype=np.float32)
+        x_mouth = np.ascontiguousarray(x_mouth, dtype=np.float32)
+        out_main, out_mouth = self._output_buffers(x_full.shape[0])
+
+        binding = self.binding
+        binding.bind_cpu_input("full_input", x_full)
+        binding.bind_cpu_input("mouth_input", x_mouth)
+        for name, buf in (("main_logits", out_main), ("mouth_logits", out_mouth)):
+            binding.bind_output(name, "cpu", 0, np.float32, buf.shape, buf.ctypes.data)
+
+        self.session.run_with_iobinding(binding)
+        return out_main, out_mouth
@@ -14,17 +14,29 @@ University of Pennsylvania
 Date: December 2025
 """
 
+import time
+_import_t0 = time.perf_counter()
+
+import os
+import json
+import threading
 import cv2
 import numpy as np
-import torch
-from torch import nn
-from torchvision.models import efficientnet_b0
-import time
+
+from frame_sources import open_source, RecordingSource
+from stream_metrics import StreamMetrics, dump_stats
+from compute_governor import ComputeGovernor
+from crop_cache import CropCache
+from emotion_events import EmotionEvents
 
 # =========================
 # 0. Configurations
 # =========================
 MODEL_PATH = "affectnet_model.pth"
+ONNX_PATH = "affectnet_7cls_mouth_full.onnx"
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pet_config.json")
+# forward_mode="auto" results, per machine / torch build / device / precision
+FORWARD_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".forward_mode.json")
 
 
 emotion_labels = [
@@ -37,82 +49,311 @@ emotion_labels = [
     "Surprise"    # 6
 ]
 
-device = "mps" if torch.backends.mps.is_available() else "cuda" if torch.cuda.is_available() else "cpu"
-print("Using device:", device)
+def load_inference_config(path=CONFIG_PATH):
+    """
+    Read emotion pipeline settings from pet_config.json (if present)
+    - inference_backend: "torch" (default) or "onnx"
+    - model_path: PyTorch checkpoint used by the torch backend
+    - onnx_path: exported model used by the onnx backend
+    - precision: torch backend mode, "fp32" | "int8-dynamic" | "int8-static" | "bf16"
+    - calibration_dir: folder of face crops used to calibrate int8-static
+    - forward_mode: torch backend forward, "auto" (time both once per machine,
+                    cached in .forward_mode.json) | "fused" (one batch-of-2N
+                    backbone pass) | "two_pass"
+    - face_tracking: detect-then-track instead of full detection every frame
+    - detect_every: frames between forced full-frame detections when tracking
+    - beautify: "off" | "preview" (whole displayed frame) | "roi" (face region only)
+    - beautify_fast: use the downscale-filter-upscale approximation
+    - classifier_input: "raw" | "beautified" face crop fed to the model
+    - multi_face: classify every detected face in one batch (default: largest only)
+    - frame_source: camera index or source spec, see frame_sources.open_source
+    - frame_pacing: "realtime" | "fast" for video / image / synthetic sources
+    - record_path: if set, save the frames the stream sees to this video file
+    - stats_interval: seconds between stream stats snapshots
+    - stats_file: if set, the stats snapshot is also dumped to this JSON file
+    - governor: adapt inference rate, detector scale and camera resolution
+                to a compute budget (see compute_governor.py)
+    - governor_target: "ms_per_s" (pipeline work per second) | "cpu_percent"
+    - governor_budget: the budget in governor_target units
+    - crop_cache: reuse the last probabilities while a face crop is unchanged
+                  (perceptual hash, see crop_cache.py)
+    - crop_cache_threshold: max differing hash bits that still count as unchanged
+    - crop_cache_max_age: seconds before a cached result is re-inferred anyway
+    - cascade: run the full-face head alone first and escalate to full
+               face + mouth fusion only for uncertain faces (PyTorch backend)
+    - cascade_margin: escalate when top-1 minus top-2 probability is below this
+    - event_min_conf / event_margin / event_confirm_s / event_min_dwell_s:
+      hysteresis for "emotion changed" events (see emotion_events.py)
+    - event_snapshot_interval: seconds between probability snapshot events (0 = off)
+    - inference_process: the Tk pet runs the stream in its own process and reads
+                         frames / results from shared memory (see shm_stream.py)
+    - emotion_server: if set (e.g. "tcp://127.0.0.1:8765"), the pets follow a
+                      running emotion_server.py instead of opening the camera
+    """
+    cfg = {
+        "inference_backend": "torch",
+        "model_path": MODEL_PATH,
+        "onnx_path": ONNX_PATH,
+        "precision": "fp32",
+        "calibration_dir": None,
+        "forward_mode": "auto",
+        "face_tracking": True,
+        "detect_every": 10,
+        "beautify": "preview",
+        "beautify_fast": False,
+        "classifier_input": "raw",
+        "multi_face": False,
+        "frame_source": 0,
+        "frame_pacing": "realtime",
+        "record_path": None,
+        "stats_interval": 1.0,
+        "stats_file": None,
+        "governor": False,
+        "governor_target": "ms_per_s",
+        "governor_budget": 300,
+        "crop_cache": True,
+        "crop_cache_threshold": 4,
+        "crop_cache_max_age": 1.0,
+        "cascade": False,
+        "cascade_margin": 0.25,
+        "event_min_conf": 0.5,
+        "event_margin": 0.1,
+        "event_confirm_s": 0.3,
+        "event_min_dwell_s": 1.0,
+        "event_snapshot_interval": 0,
+        "inference_process": True,
+        "emotion_server": None,
+    }
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                for key in cfg:
+                    if data.get(key) is not None:
+                        cfg[key] = data[key]
+        except Exception as e:
+            print("[real_time] Failed to load pet_config.json:", e)
+    return cfg
 
-# ===============================================
-# 1. Define the model architecture same as training
-# ===============================================
-class FER7WithMouth(nn.Module):
+# =========================
+# 1. Emotion engine (lazy model loading)
+# =========================
+def create_backend(config=None, timings=None):
     """
-    EfficientNet-B0 backbone + dual heads (full face + mouth)
+    Build the inference backend selected by config["inference_backend"].
+    Falls back to the PyTorch backend if ONNX Runtime or the .onnx file
+    is not available. If a timings dict is given, the time spent importing
+    the runtime and loading the weights is recorded into it.
     """
-    def __init__(self, backbone, num_classes=7):
-        super().__init__()
-        self.backbone = backbone  #
+    if config is None:
+        config = load_inference_config()
+    if timings is None:
+        timings = {}
 
-        # Main head: full face
-        self.head_main = nn.Sequential(
-            nn.Linear(1280, 256),
-            nn.ReLU(),
-            nn.Dropout(0.3),
-            nn.Linear(256, num_classes)
-        )
+    if config.get("inference_backend") == "onnx":
+        try:
+            t0 = time.perf_counter()
+            from inference_backends import OnnxBackend
+            import onnxruntime  # noqa: F401  (timed separately from session creation)
+            t1 = time.perf_counter()
+            backend = OnnxBackend(config.get("onnx_path", ONNX_PATH))
+            timings["import_s"] = t1 - t0
+            timings["weights_s"] = time.perf_counter() - t1
+            print("Using ONNX Runtime backend")
+            return backend
+        except Exception as e:
+            print("ONNX Runtime not available, fallback to PyTorch. Error:", e)
+
+    t0 = time.perf_counter()
+    import torch
+    from inference_backends import TorchBackend
+    from fer_model import build_model, select_device, apply_precision
+    t1 = time.perf_counter()
+
+    precision = config.get("precision", "fp32")
+    # INT8 kernels and bf16 autocast are CPU paths
+    device = select_device() if precision == "fp32" else "cpu"
+    print("Using device:", device)
+    model = build_model(config.get("model_path", MODEL_PATH), device)
+
+    if precision != "fp32":
+        calib = None
+        if precision == "int8-static" and config.get("calibration_dir"):
+            calib = [torch.from_numpy(np.concatenate(pair))
+                     for pair in load_face_crops(config["calibration_dir"], limit=128)]
+        model, precision = apply_precision(model, precision, calib)
+    timings["import_s"] = t1 - t0
+    timings["weights_s"] = time.perf_counter() - t1
+
+    backend = TorchBackend(model, device, precision)
+    forward_mode = config.get("forward_mode", "auto")
+    if forward_mode == "auto":
+        batch_sizes = (1, 2) if config.get("multi_face") else (1,)
+        forward_mode = select_forward_mode(backend, batch_sizes, timings)
+    backend.forward_mode = forward_mode
+
+    print(f"Using PyTorch backend ({precision}, {backend.forward_mode})")
+    return backend
+
+
+def _forward_cache_key(backend, batch_sizes):
+    import platform
+    torch = backend.torch
+    return "|".join(str(v) for v in (
+        platform.node(), platform.machine(), platform.processor(), os.cpu_count(),
+        torch.__version__, torch.get_num_threads(), backend.device, backend.precision,
+        batch_sizes))
+
+
+def select_forward_mode(backend, batch_sizes=(1,), timings=None, path=FORWARD_CACHE_PATH):
+    """
+    forward_mode="auto": the faster torch forward for this machine. Measured
+    once (TorchBackend.select_forward, ~2 s) and then read from `path`.
+    """
+    key = _forward_cache_key(backend, batch_sizes)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if isinstance(cache.get(key), dict) and cache[key].get("mode") in ("fused", "two_pass"):
+        return cache[key]["mode"]
+
+    t0 = time.perf_counter()
+    ms = backend.select_forward(IMG_SIZE, batch_sizes)
+    if timings is not None:
+        timings["forward_select_s"] = time.perf_counter() - t0
+    print(f"[real_time] Forward path: {backend.forward_mode} "
+          f"(two-pass {ms['two_pass_ms']:.1f} ms, fused {ms['fused_ms']:.1f} ms)")
+    cache[key] = dict(ms, mode=backend.forward_mode)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
+    except OSError as e:
+        print("[real_time] Failed to cache the forward mode:", e)
+    return backend.forward_mode
 
-        # Secondary head: mouth only
-        self.head_mouth = nn.Sequential(
-            nn.Linear(1280, 128),
-            nn.ReLU(),
-            nn.Dropout(0.3),
-            nn.Linear(128, num_classes)
-        )
 
-    def forward(self, x_full, x_mouth):
-        feat_full = self.backbone(x_full)    # [B, 1280]
-        feat_mouth = self.backbone(x_mouth)  # [B, 1280]
+class EmotionEngine:
+    """
+    Owns the inference backend for the emotion stream.
+    Constructing an engine is free: the runtime is imported and the weights
+    are loaded on first use (load / infer) or on a background thread
+    (load_async), so UI processes can show their first frame immediately.
+    """
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_inference_config()
+        self.backend = None
+        self.timings = {}   # import_s, weights_s, first_inference_s
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def load(self):
+        """Load the backend on the calling thread (no-op once loaded)"""
+        with self._lock:
+            if self.backend is None:
+                self.backend = create_backend(self.config, self.timings)
+                self._ready.set()
+        return self.backend
+
+    def load_async(self):
+        """Start loading on a daemon thread and return immediately"""
+        with self._lock:
+            if self._thread is None and self.backend is None:
+                self._thread = threading.Thread(target=self.load, daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def infer(self, x_full, x_mouth):
+        backend = self.backend or self.load()
+        if "first_inference_s" in self.timings:
+            return backend.infer(x_full, x_mouth)
+
+        t0 = time.perf_counter()
+        out = backend.infer(x_full, x_mouth)
+        self.timings["first_inference_s"] = time.perf_counter() - t0
+        self.print_startup_report()
+        return out
+
+    @property
+    def supports_main_only(self):
+        return (self.backend or self.load()).supports_main_only
+
+    def infer_main(self, x_full):
+        return (self.backend or self.load()).infer_main(x_full)
+
+    def infer_mouth(self, x_mouth):
+        return (self.backend or self.load()).infer_mouth(x_mouth)
+
+    def startup_report(self):
+        report = {"module_import_s": MODULE_IMPORT_S}
+        report.update(self.timings)
+        report["backend"] = self.backend.name if self.backend is not None else None
+        return report
+
+    def print_startup_report(self):
+        r = self.startup_report()
+        parts = [f"{k[:-2]} {v:.2f}s" for k, v in r.items() if k.endswith("_s") and v is not None]
+        print(f"[real_time] Startup ({r['backend']}): " + ", ".join(parts))
 
-        logits_main = self.head_main(feat_full)
-        logits_mouth = self.head_mouth(feat_mouth)
-        return logits_main, logits_mouth
 
-    def forward_main(self, x_full):
-        feat_full = self.backbone(x_full)
-        return self.head_main(feat_full)
+_default_engine = None
 
 
-# construct backbone
-base = efficientnet_b0(weights=None)
-base.classifier = nn.Identity()
+def get_engine():
+    """Process-wide engine shared by every stream (created on first call)"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = EmotionEngine()
+    return _default_engine
 
-# construct full model
-model = FER7WithMouth(base, num_classes=7).to(device)
 
-# load weights
-state = torch.load(MODEL_PATH, map_location=device)
-model.load_state_dict(state, strict=True)
-model.eval()
-print("Loaded model from", MODEL_PATH)
+def __getattr__(name):
+    # Keep real_time.FER7WithMouth / build_model importable without paying
+    # for torch at module import time.
+    if name in ("FER7WithMouth", "build_model", "select_device"):
+        import fer_model
+        return getattr(fer_model, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # =========================
 # 2. Preprocessing functions
 # =========================
 IMG_SIZE = 224
+MOUTH_ALPHA = 0.5   # weight of the mouth head in the logit fusion
 
 mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
 std  = np.array([0.229, 0.224, 0.225], dtype=np.float32)
 
+def to_chw_normalized(img_bgr):
+    """
+    BGR -> RGB -> [0,1] -> normalize -> CHW numpy float32 [3,H,W]
+    """
+    img = cv2.resize(img_bgr, (IMG_SIZE, IMG_SIZE))
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = img.astype(np.float32) / 255.0
+    img = (img - mean) / std
+    img = np.transpose(img, (2, 0, 1))  # HWC -> CHW
+    return np.ascontiguousarray(img, dtype=np.float32)
+
+
 def preprocess_full(face_bgr):
     """
     Full face preprocessing: BGR -> RGB -> [0,1] -> normalize -> CHW torch float32
     """
-    face = cv2.resize(face_bgr, (IMG_SIZE, IMG_SIZE))
-    face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
-    face = face.astype(np.float32) / 255.0
-    face = (face - mean) / std
-    face = np.transpose(face, (2, 0, 1))  # HWC -> CHW
-    tensor = torch.from_numpy(face).unsqueeze(0)  # [1,3,H,W]
-    return tensor.float()   
+    import torch
+    tensor = torch.from_numpy(to_chw_normalized(face_bgr)).unsqueeze(0)  # [1,3,H,W]
+    return tensor.float()
 
 
 def crop_mouth_np(face_bgr):
@@ -133,38 +374,142 @@ def preprocess_mouth(face_bgr):
     """
     mouth processing: crop mouth -> BGR -> RGB -> [0,1] -> normalize -> CHW torch float32
     """
+    import torch
     mouth = crop_mouth_np(face_bgr)
-    mouth = cv2.resize(mouth, (IMG_SIZE, IMG_SIZE))
-    mouth = cv2.cvtColor(mouth, cv2.COLOR_BGR2RGB)
-    mouth = mouth.astype(np.float32) / 255.0
-    mouth = (mouth - mean) / std
-    mouth = np.transpose(mouth, (2, 0, 1))
-    tensor = torch.from_numpy(mouth).unsqueeze(0)
+    tensor = torch.from_numpy(to_chw_normalized(mouth)).unsqueeze(0)
     return tensor.float()
 
 
+class FacePreprocessor:
+    """
+    Allocation-free preprocessing for the fused model input.
+    Full-face and mouth crops are resized into reusable scratch images and
+    written, already RGB-ordered and normalized, straight into a
+    preallocated float32 batch of shape [2, max_faces, 3, H, W]:
+    batch[0] holds full faces, batch[1] mouth crops.
+    Normalization is folded into one multiply-add per channel:
+    (x / 255 - mean) / std == x * (1 / (255 * std)) - mean / std
+    """
+    def __init__(self, max_faces=1, size=IMG_SIZE):
+        self.size = size
+        self.batch = np.empty((2, max_faces, 3, size, size), dtype=np.float32)
+        self._resized = np.empty((size, size, 3), dtype=np.uint8)
+        self._resized_f = np.empty((size, size, 3), dtype=np.float32)
+        self._scale = (1.0 / (255.0 * std)).astype(np.float32)   # RGB order
+        self._bias = (-mean / std).astype(np.float32)
+
+    def _write(self, img_bgr, out):
+        cv2.resize(img_bgr, (self.size, self.size), dst=self._resized)
+        np.copyto(self._resized_f, self._resized)   # contiguous cast, no temp buffer
+        for c in range(3):   # out is RGB planes, source is BGR
+            np.multiply(self._resized_f[:, :, 2 - c], self._scale[c], out=out[c])
+            out[c] += self._bias[c]
+
+    def __call__(self, faces):
+        """
+        faces: list of BGR face crops.
+        Returns (x_full, x_mouth) views [N,3,H,W] into the shared batch; they
+        are overwritten by the next call.
+        """
+        n = len(faces)
+        if n > self.batch.shape[1]:
+            self.batch = np.empty((2, n, 3, self.size, self.size), dtype=np.float32)
+
+        for i, face in enumerate(faces):
+            self._write(face, self.batch[0, i])
+            self._write(crop_mouth_np(face), self.batch[1, i])
+        return self.batch[0, :n], self.batch[1, :n]
+
+
+def smooth_probs(ema_probs, probs, ema_alpha=0.7):
+    """
+    One EMA step over class probabilities (ema_probs=None starts a new track),
+    with Fear merged into Surprise
+    """
+    if ema_probs is None:
+        ema_probs = probs.copy()   # probs may be a cached result, never modify it
+    else:
+        ema_probs = ema_alpha * ema_probs + (1 - ema_alpha) * probs
+
+    # merge Fear into Surprise (your original logic)
+    ema_probs[6] += ema_probs[2]
+    ema_probs[2] = 0
+    return ema_probs
+
+
+def load_face_crops(folder, limit=None):
+    """
+    Read face crops (jpg/png, subfolders included) and preprocess each into
+    a (full, mouth) pair of float32 arrays [1,3,H,W].
+    Used for INT8 calibration and precision/accuracy checks.
+    """
+    exts = (".jpg", ".jpeg", ".png", ".bmp")
+    paths = []
+    for root, _, files in os.walk(folder):
+        paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(exts))
+    paths.sort()
+    if limit:
+        paths = paths[:limit]
+
+    pairs = []
+    for p in paths:
+        img = cv2.imread(p)
+        if img is None:
+            continue
+        pairs.append((to_chw_normalized(img)[None], to_chw_normalized(crop_mouth_np(img))[None]))
+    return pairs
+
+
+def merge_fear(probs):
+    """Copy of [..., 7] probabilities with Fear merged into Surprise, as smooth_probs does"""
+    merged = probs.copy()
+    merged[..., 6] += merged[..., 2]
+    merged[..., 2] = 0
+    return merged
+
+
+def softmax_np(logits):
+    """
+    Row-wise softmax for numpy logits [B,C]
+    """
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
 # =========================
 # 3. Face detector class
 # =========================
 class FaceDetector:
-    def __init__(self, min_conf=0.6):
-        try:
-            import mediapipe as mp
-            self.mode = "mediapipe"
-            self.mp = mp
-            self.detector = mp.solutions.face_detection.FaceDetection(
-                model_selection=1,
-                min_detection_confidence=min_conf
-            )
-            print("Using MediaPipe face detector")
-        except Exception as e:
-            print("MediaPipe not available, fallback to Haar cascade. Error:", e)
-            self.mode = "haar"
-            self.detector = cv2.CascadeClassifier(
-                cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-            )
+    def __init__(self, min_conf=0.6, mode=None):
+        """
+        mode: None = MediaPipe with Haar fallback, or force "mediapipe" / "haar"
+        """
+        if mode != "haar":
+            try:
+                import mediapipe as mp
+                self.mode = "mediapipe"
+                self.mp = mp
+                self.detector = mp.solutions.face_detection.FaceDetection(
+                    model_selection=1,
+                    min_detection_confidence=min_conf
+                )
+                print("Using MediaPipe face detector")
+                return
+            except Exception as e:
+                if mode == "mediapipe":
+                    raise
+                print("MediaPipe not available, fallback to Haar cascade. Error:", e)
 
-    def detect(self, frame):
+        self.mode = "haar"
+        self.detector = cv2.CascadeClassifier(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        )
+
+    def detect(self, frame, min_size=None, max_size=None):
+        """
+        Returns a list of (x, y, w, h) boxes.
+        min_size / max_size bound the Haar search scales (ignored by MediaPipe).
+        """
         H, W = frame.shape[:2]
         boxes = []
 
@@ -180,12 +525,167 @@ class FaceDetector:
                     boxes.append((x1, y1, x2 - x1, y2 - y1))
         else:
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.detector.detectMultiScale(gray, 1.1, 5)
+            faces = self.detector.detectMultiScale(
+                gray, scaleFactor=1.1, minNeighbors=5,
+                minSize=min_size or (0, 0), maxSize=max_size or (0, 0)
+            )
             for (x, y, w, h) in faces:
-                boxes.append((x, y, w, h))
+                boxes.append((int(x), int(y), int(w), int(h)))
 
         return boxes
 
+
+# cheap correlation trackers, in order of preference (opencv-contrib only);
+# TrackerMIL from the main package costs more than a MediaPipe detection
+CV_TRACKERS = ("TrackerMOSSE_create", "TrackerKCF_create")
+
+
+def create_cv_tracker():
+    """A fast cv2 box tracker, or None if this OpenCV build has none"""
+    for module in (getattr(cv2, "legacy", None), cv2):
+        for name in CV_TRACKERS:
+            factory = getattr(module, name, None) if module is not None else None
+            if factory is not None:
+                return factory()
+    return None
+
+
+class FaceTracker:
+    """
+    Detect-then-track wrapper with the same detect() interface as FaceDetector.
+    A full-frame detection runs every `detect_every` frames or whenever the
+    face is lost. In between:
+    - Haar only searches a padded ROI around the previous box, restricted
+      to similar face sizes, which is a fraction of the full-frame cost.
+    - MediaPipe resizes any input to its fixed network size, so an ROI
+      search would cost as much as a full frame. It instead follows the
+      face with a cheap cv2 tracker (MOSSE / KCF, opencv-contrib), or,
+      without one, keeps the previous box until the next refresh. Either
+      box is checked against a thumbnail of the last detected face
+      (normalised correlation); if the face moved or left, detection runs
+      on that frame instead of classifying a stale box.
+    The box is smoothed with an EMA so the padded crop handed to the model
+    stays stable from frame to frame.
+    """
+    THUMB = 24  # side of the grey thumbnail used for the correlation check
+
+    def __init__(self, detector, detect_every=10, roi_pad=0.5, smooth=0.6, min_corr=0.6):
+        self.detector = detector
+        self.mode = detector.mode
+        self.detect_every = max(1, int(detect_every))
+        self.roi_pad = roi_pad
+        self.smooth = smooth
+        self.use_roi = self.mode == "haar"
+        self.min_corr = min_corr
+
+        self.box = None          # smoothed (x, y, w, h) as floats
+        self.cv_tracker = None   # MediaPipe mode: cv2 tracker started at the last detection
+        self.template = None     # MediaPipe mode: thumbnail of the last detected face
+        self.since_full = 0
+        self.full_detections = 0
+        self.roi_detections = 0
+        self.tracked_frames = 0  # MediaPipe mode: frames without any detection
+        self.track_failures = 0  # MediaPipe mode: followed boxes rejected by the check
+
+    def reset(self):
+        self.box = None
+        self.cv_tracker = None
+        self.template = None
+
+    def _thumb(self, frame, box):
+        """Zero-mean, unit-norm grey thumbnail of the box (None if empty)"""
+        x, y, w, h = (int(round(v)) for v in box)
+        crop = frame[max(0, y):y + h, max(0, x):x + w]
+        if crop.size == 0:
+            return None
+        grey = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        t = cv2.resize(grey, (self.THUMB, self.THUMB), interpolation=cv2.INTER_AREA).astype(np.float32)
+        t -= t.mean()
+        norm = float(np.linalg.norm(t))
+        return t / norm if norm > 1e-6 else None
+
+    def _follow(self, frame):
+        """
+        MediaPipe mode: box from the cv2 tracker, or the held box; None when
+        tracking failed or the box no longer looks like the detected face
+        """
+        if self.cv_tracker is None:
+            box = tuple(self.box)
+        else:
+            ok, box = self.cv_tracker.update(frame)
+            if not ok:
+                return None
+            box = tuple(box)
+        thumb = self._thumb(frame, box)
+        if self.template is None or thumb is None or float((thumb * self.template).sum()) < self.min_corr:
+            self.track_failures += 1
+            return None
+        return box
+
+    def _start_cv_tracker(self, frame, box):
+        if self.use_roi:
+            return
+        self.template = self._thumb(frame, box)
+        self.cv_tracker = create_cv_tracker()
+        if self.cv_tracker is not None:
+            self.cv_tracker.init(frame, tuple(int(v) for v in box))
+
+    def _search_roi(self, frame):
+        x, y, w, h = self.box
+        size = max(w, h)
+        pad = self.roi_pad * size
+        H, W = frame.shape[:2]
+        rx1 = int(max(0, x - pad))
+        ry1 = int(max(0, y - pad))
+        rx2 = int(min(W, x + w + pad))
+        ry2 = int(min(H, y + h + pad))
+
+        roi = frame[ry1:ry2, rx1:rx2]
+        if roi.size == 0:
+            return None
+
+        boxes = self.detector.detect(
+            roi,
+            min_size=(int(0.6 * size), int(0.6 * size)),
+            max_size=(int(1.6 * size), int(1.6 * size)),
+        )
+        if not boxes:
+            return None
+        bx, by, bw, bh = max(boxes, key=lambda b: b[2] * b[3])
+        return (bx + rx1, by + ry1, bw, bh)
+
+    def detect(self, frame):
+        box = None
+        if self.box is not None and self.since_full < self.detect_every:
+            if self.use_roi:
+                box = self._search_roi(frame)
+                if box is not None:
+                    self.roi_detections += 1
+            else:
+                box = self._follow(frame)
+                if box is not None:
+                    self.tracked_frames += 1
+            if box is not None:
+                self.since_full += 1
+
+        if box is None:
+            # periodic refresh, first frame, or the face left the ROI
+            boxes = self.detector.detect(frame)
+            self.full_detections += 1
+            self.since_full = 0
+            if not boxes:
+                self.box = None
+                return []
+            box = max(boxes, key=lambda b: b[2] * b[3])
+            if self.box is None:
+                self.box = tuple(float(v) for v in box)
+            self._start_cv_tracker(frame, box)
+
+        a = self.smooth
+        self.box = tuple(a * p + (1 - a) * n for p, n in zip(self.box, box))
+        return [tuple(int(round(v)) for v in self.box)]
+
+
 def beautify(img, smooth=25, whiten=1.08):
     """
     Simple beautification using bilateral filter and exposure adjustment
@@ -207,112 +707,720 @@ def beautify(img, smooth=25, whiten=1.08):
 
     return softlight
 
+
+def beautify_fast(img, smooth=25, whiten=1.08, scale=0.5):
+    """
+    Approximate beautify(): the smoothing/whitening layer only feeds a
+    sigma-15 Gaussian blur, i.e. it is low-frequency, so it is computed at
+    `scale` resolution and upsampled before the soft light blend with the
+    full-resolution image.
+    """
+    H, W = img.shape[:2]
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    smooth_img = cv2.bilateralFilter(small, d=5, sigmaColor=smooth*2, sigmaSpace=smooth*scale)
+    whiten_img = cv2.convertScaleAbs(smooth_img, alpha=whiten, beta=3)
+    output = cv2.addWeighted(small, 0.3, whiten_img, 0.7, 0)
+    blur = cv2.GaussianBlur(output, (0,0), sigmaX=15*scale)
+    blur = cv2.resize(blur, (W, H), interpolation=cv2.INTER_LINEAR)
+
+    return cv2.addWeighted(img, 0.6, blur, 0.4, 0)
+
+
+def beautify_roi(frame, box, fn=beautify):
+    """
+    Beautify only the (x1, y1, x2, y2) region of frame, in place
+    """
+    x1, y1, x2, y2 = box
+    roi = frame[y1:y2, x1:x2]
+    if roi.size > 0:
+        frame[y1:y2, x1:x2] = fn(roi)
+    return frame
+
 # =========================
-# 4. Real-time inference loop (face + mouth)
+# 4. Pipeline plumbing: latest-frame-wins slots and face identities
 # =========================
-def start_emotion_stream(callback=None, show_window=True, frame_holder=None, state=None):
-    print("[real_time] Starting emotion detection stream...")
-    
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        print("❌ Cannot open camera")
-        return
-
-    cap.set(3, 640)   # width
-    cap.set(4, 360)   # height
-    detector = FaceDetector()
-
-    ema_probs = None
-    ema_alpha = 0.7
-    MOUTH_ALPHA = 0.5
-    prev_time = time.time()
-    fps = 0.0
-
-    while True:
-        ret, frame = cap.read()
-        frame = beautify(frame)
-        if not ret:
-            break
-
-        boxes = detector.detect(frame)
-        label_text = "No face"
-        emotion_label = None
-        conf = 0.0
-
-        if len(boxes) > 0:
-            # take the largest face
-            areas = [w * h for (x, y, w, h) in boxes]
-            idx = int(np.argmax(areas))
-            x, y, w, h = boxes[idx]
+class LatestSlot:
+    """
+    Bounded single-slot queue between two pipeline stages.
+    put() never blocks: a value that was not consumed yet is replaced
+    (latest wins) and counted in `dropped`. get() waits for a value and
+    returns None on timeout or once the slot is closed.
+    With lossless=True (replaying a recording as fast as possible) put()
+    instead waits until the previous value was taken, so every frame is
+    processed and the result does not depend on machine speed.
+    """
+    def __init__(self, lossless=False):
+        self._cond = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self.closed = False
+        self.dropped = 0
+        self.lossless = lossless
+
+    def put(self, item):
+        with self._cond:
+            if self.lossless:
+                self._cond.wait_for(lambda: not self._has_item or self.closed)
+                if self.closed:
+                    self.dropped += 1
+                    return
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._has_item or self.closed, timeout)
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            self._cond.notify_all()   # a lossless put() may be waiting
+            return item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+def box_iou(a, b):
+    """IoU of two (x1, y1, x2, y2) boxes"""
+    iw = min(a[2], b[2]) - max(a[0], b[0])
+    ih = min(a[3], b[3]) - max(a[1], b[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceIdentities:
+    """
+    Simple IoU tracker that keeps a stable ID per face across frames.
+    Boxes are greedily matched to the previous frame's tracks by IoU; a
+    track that goes unmatched for more than `max_missed` frames is dropped.
+    """
+    def __init__(self, iou_threshold=0.3, max_missed=15):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks = {}   # id -> [box, frames missed]
+        self.next_id = 0
+
+    def assign(self, boxes):
+        pairs = sorted(
+            ((box_iou(track[0], box), tid, i)
+             for tid, track in self.tracks.items()
+             for i, box in enumerate(boxes)),
+            reverse=True,
+        )
+        ids = [None] * len(boxes)
+        used = set()
+        for iou, tid, i in pairs:
+            if iou < self.iou_threshold:
+                break
+            if tid in used or ids[i] is not None:
+                continue
+            ids[i] = tid
+            used.add(tid)
+
+        for i, box in enumerate(boxes):
+            if ids[i] is None:
+                ids[i] = self.next_id
+                self.next_id += 1
+            self.tracks[ids[i]] = [box, 0]
+
+        for tid in list(self.tracks):
+            if tid not in ids:
+                self.tracks[tid][1] += 1
+                if self.tracks[tid][1] > self.max_missed:
+                    del self.tracks[tid]
+        return ids
+
+
+# =========================
+# 5. Real-time inference pipeline (face + mouth)
+# =========================
+class EmotionStream:
+    """
+    Staged camera pipeline:
+        capture thread -> [frame slot] -> detect/infer thread -> [result slot] -> consumer
+    The consumer (callback, shared state, preview window) runs on the thread
+    that calls run(). Because both slots keep only the newest item, a slow
+    model never backs up the camera; stale frames are dropped, and the
+    reported emotion is at most one inference behind the newest frame.
+
+    The stream doubles as a control handle: pause() releases the camera and
+    idles the inference thread, resume() reopens it, stop() ends run().
+    With show_window=False no HighGUI (imshow / waitKey) call is made, so
+    the stream also runs on headless OpenCV builds.
+    """
+    def __init__(self, callback=None, show_window=True, frame_holder=None, state=None,
+                 backend=None, engine=None, config=None, faces_callback=None, source=None,
+                 stats_callback=None, event_callback=None):
+        self.config = config if config is not None else load_inference_config()
+        self.source = source
+        self.stats_callback = stats_callback
+        self.callback = callback
+        self.faces_callback = faces_callback
+        self.event_callback = event_callback
+        self.show_window = show_window
+        self.frame_holder = frame_holder
+        self.state = state
+        if backend is None and engine is None:
+            # an explicit config gets its own engine (backend, model_path,
+            # precision, ...); the shared one is built from pet_config.json
+            engine = EmotionEngine(config) if config is not None else get_engine()
+        self.backend = backend if backend is not None else engine
+
+        self.metrics = StreamMetrics()
+        self.frames = LatestSlot()
+        self.results = LatestSlot()
+        self._stop = threading.Event()
+        self._active = threading.Event()   # cleared while paused
+        self._active.set()
+        self._thread = None
+
+        self.ema_alpha = 0.7
+        self.face_ema = {}    # face id -> smoothed probabilities
+        self.multi_face = bool(self.config.get("multi_face"))
+        self.identities = FaceIdentities()
+
+        self.beautify_mode = self.config.get("beautify", "preview")
+        self.beautify_fn = beautify_fast if self.config.get("beautify_fast") else beautify
+        self.beautify_input = self.config.get("classifier_input") == "beautified"
+
+        self.preprocess = FacePreprocessor()
+
+        self.events = EmotionEvents(
+            emotion_labels,
+            min_conf=self.config.get("event_min_conf", 0.5),
+            margin=self.config.get("event_margin", 0.1),
+            confirm_s=self.config.get("event_confirm_s", 0.3),
+            min_dwell_s=self.config.get("event_min_dwell_s", 1.0),
+            snapshot_interval=self.config.get("event_snapshot_interval", 0),
+        )
+
+        self.cascade = bool(self.config.get("cascade"))
+        self.cascade_margin = float(self.config.get("cascade_margin", 0.25))
+
+        self.crop_cache = None
+        self._ms_per_face = 0.0   # latest preprocess + infer cost of one face
+        if self.config.get("crop_cache"):
+            self.crop_cache = CropCache(
+                threshold=self.config.get("crop_cache_threshold", 4),
+                max_age=self.config.get("crop_cache_max_age", 1.0),
+            )
+
+        self.governor = None
+        if self.config.get("governor"):
+            self.governor = ComputeGovernor(
+                target=self.config.get("governor_target", "ms_per_s"),
+                budget=self.config.get("governor_budget", 300),
+            )
+
+    # ---------- stage 1: capture ----------
+    def _capture_loop(self, cap):
+        seq = 0
+        resolution = None
+        try:
+            while not self._stop.is_set():
+                # governor-selected camera size (only sources that support it)
+                if self.governor is not None and hasattr(cap, "set_resolution"):
+                    wanted = self.governor.settings["resolution"]
+                    if wanted != resolution:
+                        cap.set_resolution(*wanted)
+                        resolution = wanted
+
+                if not self._active.is_set():
+                    if not self._wait_paused(cap):
+                        break
+                    resolution = None   # reapply the governor size to the reopened device
+                    continue
+
+                t0 = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    print("[real_time] Frame source ended or camera read failed, stopping stream")
+                    break
+                t_capture = time.perf_counter()
+                self.metrics.add("capture", (t_capture - t0) * 1000.0)
+                self.metrics.incr("frames_captured")
+
+                seq += 1
+                self.frames.put((seq, t_capture, frame))
+        finally:
+            cap.release()
+            self.frames.close()
+
+    def _wait_paused(self, cap):
+        """Hold the capture stage while paused; False if it should exit"""
+        cap.suspend()
+        print("[real_time] Stream paused, camera released")
+        while not self._active.wait(timeout=0.5):
+            if self._stop.is_set():
+                return False
+        if self._stop.is_set():
+            return False
+        if not cap.resume():
+            print("❌ Cannot reopen camera / frame source after pause")
+            return False
+        print("[real_time] Stream resumed")
+        return True
+
+    # ---------- stage 2: detect + infer ----------
+    def _infer_loop(self, detector):
+        gov = self.governor
+        try:
+            while not self._stop.is_set():
+                if gov is not None:
+                    # rate cap: sleep first, then take whatever frame is newest
+                    wait = gov.time_until_next_infer()
+                    if wait > 0 and self._stop.wait(wait):
+                        break
+
+                item = self.frames.get(timeout=0.5)
+                if item is None:
+                    if self.frames.closed:
+                        break
+                    continue
 
+                seq, t_capture, frame = item
+                if gov is not None:
+                    gov.mark_infer()
+                    scale = gov.settings["detect_scale"]
+                    result = self._process_frame(frame, detector, scale)
+                    if gov.update() and hasattr(detector, "reset"):
+                        detector.reset()   # tracker box may be in the old scale
+                else:
+                    result = self._process_frame(frame, detector)
+                result["seq"] = seq
+                result["t_capture"] = t_capture
+                self.results.put(result)
+        finally:
+            self.results.close()
+
+    def _face_crops(self, frame, boxes):
+        """Padded face crops and their (x1, y1, x2, y2) boxes"""
+        H, W = frame.shape[:2]
+        crops, padded = [], []
+        for (x, y, w, h) in boxes:
             pad = int(0.15 * max(w, h))
             x1 = max(0, x - pad)
             y1 = max(0, y - pad)
-            x2 = min(frame.shape[1], x + w + pad)
-            y2 = min(frame.shape[0], y + h + pad)
+            x2 = min(W, x + w + pad)
+            y2 = min(H, y + h + pad)
 
             face = frame[y1:y2, x1:x2]
-
             if face.size > 0:
-                full_t = preprocess_full(face).to(device)
-                mouth_t = preprocess_mouth(face).to(device)
+                crops.append(face)
+                padded.append((x1, y1, x2, y2))
+        return crops, padded
+
+    def _smooth(self, face_id, probs):
+        ema_probs = smooth_probs(self.face_ema.get(face_id), probs, self.ema_alpha)
+        self.face_ema[face_id] = ema_probs
+        return ema_probs
+
+    def _detect(self, frame, detector, scale=1.0):
+        """Run the detector on a downscaled copy and map boxes back to the frame"""
+        if scale >= 1.0:
+            return detector.detect(frame)
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return [tuple(int(v / scale) for v in b) for b in detector.detect(small)]
+
+    def _add_stage(self, stage, ms):
+        self.metrics.add(stage, ms)
+        if self.governor is not None:
+            self.governor.add_work(ms)
+
+    def _infer_cascade(self, x_full, x_mouth, ids):
+        """
+        Full-face head first (N backbone rows). Faces whose top-class margin
+        is below cascade_margin, or whose cheap label disagrees with the
+        smoothed one, get the mouth branch as well (one more row each) and
+        are fused with the full-face logits already computed, so no face
+        ever costs more backbone rows than the plain fused path.
+        """
+        logits_main = self.backend.infer_main(x_full)
+        probs = softmax_np(logits_main).astype(np.float32)   # [N,7]
+        merged = merge_fear(probs)
+        top2 = np.sort(merged, axis=1)[:, -2:]
+        escalate = []
+        for i, face_id in enumerate(ids):
+            ema = self.face_ema.get(face_id)
+            if (ema is None
+                    or top2[i, 1] - top2[i, 0] < self.cascade_margin
+                    or int(np.argmax(merged[i])) != int(np.argmax(ema))):
+                escalate.append(i)
+
+        self.metrics.incr("cascade_cheap", len(ids) - len(escalate))
+        if escalate:
+            self.metrics.incr("cascade_escalated", len(escalate))
+            if len(escalate) < len(ids):
+                x_mouth = x_mouth[escalate]
+            logits_mouth = self.backend.infer_mouth(x_mouth)
+            probs[escalate] = softmax_np(logits_main[escalate] + MOUTH_ALPHA * logits_mouth)
+        return probs
+
+    def _process_frame(self, frame, detector, detect_scale=1.0):
+        metrics = self.metrics
+
+        t1 = time.perf_counter()
+        boxes = self._detect(frame, detector, detect_scale)
+        t2 = time.perf_counter()
+        self._add_stage("detect", (t2 - t1) * 1000.0)
+
+        result = {
+            "frame": frame,
+            "label_text": "No face",
+            "emotion_label": None,
+            "conf": 0.0,
+            "probs": None,
+            "state_label": None,   # value for state["detected_emotion"], None = leave as is
+            "box": None,           # padded box (x1, y1, x2, y2) of the primary face
+            "faces": [],           # per-face results, primary (largest) face first
+        }
+
+        if len(boxes) == 0:
+            metrics.incr("detection_misses")
+            result["state_label"] = "No face"
+            return result
+
+        # largest face first; single-face mode keeps only that one
+        boxes = sorted(boxes, key=lambda b: b[2] * b[3], reverse=True)
+        if not self.multi_face:
+            boxes = boxes[:1]
+
+        crops, padded = self._face_crops(frame, boxes)
+        if not crops:
+            return result
+        ids = self.identities.assign(padded) if self.multi_face else [0]
+
+        # ---- unchanged crops reuse their last probabilities ----
+        cache = self.crop_cache
+        probs = [None] * len(crops)
+        if cache is not None:
+            keys = [cache.key(c, crop_mouth_np(c)) for c in crops]
+            probs = [cache.lookup(face_id, k) for face_id, k in zip(ids, keys)]
+            t_hash = time.perf_counter()
+            hash_ms = (t_hash - t2) * 1000.0
+            self._add_stage("crop_hash", hash_ms)
+            t2 = t_hash
+        todo = [i for i, p in enumerate(probs) if p is None]
+
+        beautified = [None] * len(crops)
+        if todo:
+            batch = [crops[i] for i in todo]
+            if self.beautify_input:
+                batch = [self.beautify_fn(c) for c in batch]
+                for i, c in zip(todo, batch):
+                    beautified[i] = c
+
+            x_full, x_mouth = self.preprocess(batch)              # [N,3,H,W] each
+            t3 = time.perf_counter()
+            self._add_stage("preprocess", (t3 - t2) * 1000.0)
+
+            if self.cascade and self.backend.supports_main_only:
+                batch_probs = self._infer_cascade(x_full, x_mouth, [ids[i] for i in todo])
+            else:
+                # one batched forward for every face (2N rows through the backbone)
+                logits_main, logits_mouth = self.backend.infer(x_full, x_mouth)
+                logits = logits_main + MOUTH_ALPHA * logits_mouth
+                batch_probs = softmax_np(logits).astype(np.float32)  # [N,7]
+            t4 = time.perf_counter()
+            self._add_stage("infer", (t4 - t3) * 1000.0)
+            metrics.incr("inferences")
+            metrics.incr("faces_classified", len(todo))
+            if metrics.counters["inferences"] > 1:   # the first call includes model loading
+                self._ms_per_face = (t4 - t2) * 1000.0 / len(todo)
+
+            for j, i in enumerate(todo):
+                probs[i] = batch_probs[j]
+                if cache is not None:
+                    cache.store(ids[i], keys[i], batch_probs[j])
+
+        if cache is not None:
+            hits = len(crops) - len(todo)
+            metrics.incr("crop_cache_hits", hits)
+            cache.record(hits, len(todo), self._ms_per_face, hash_ms)
+
+        # ---- per-face smoothing ----
+        for i, face_id in enumerate(ids):
+            ema_probs = self._smooth(face_id, probs[i])
+            cls = int(np.argmax(ema_probs))
+            result["faces"].append({
+                "id": face_id,
+                "box": padded[i],
+                "label": emotion_labels[cls],
+                "conf": float(ema_probs[cls]),
+                "probs": ema_probs.copy(),
+                "face_beautified": beautified[i],
+            })
+        if self.multi_face:
+            for face_id in list(self.face_ema):
+                if face_id not in self.identities.tracks:
+                    del self.face_ema[face_id]
+            if cache is not None:
+                cache.prune(self.identities.tracks)
+
+        primary = result["faces"][0]
+        result.update(
+            label_text=f"{primary['label']} {primary['conf']*100:.1f}%",
+            emotion_label=primary["label"],
+            conf=primary["conf"],
+            probs=primary["probs"],
+            state_label=primary["label"],
+            box=primary["box"],
+        )
+        return result
+
+    # ---------- stage 3: consumer ----------
+    def _consume_loop(self):
+        prev_time = time.perf_counter()
+        last_stats = prev_time
+        stats_interval = float(self.config.get("stats_interval", 1.0))
+        stats_file = self.config.get("stats_file")
+        fps = 0.0
+
+        while not self._stop.is_set():
+            r = self.results.get(timeout=0.1)
+            if r is None:
+                if self.results.closed:
+                    break
+                # keep stats flowing while inference is stalled (e.g. model loading)
+                now = time.perf_counter()
+                if now - last_stats >= stats_interval:
+                    last_stats = now
+                    self._publish_stats(stats_file)
+                if self.show_window:
+                    if cv2.waitKey(1) & 0xFF == ord('q'):   # keep the preview window responsive
+                        break
+                continue
 
-                with torch.no_grad():
-                    logits_main, logits_mouth = model(full_t, mouth_t)
-                    logits = logits_main + MOUTH_ALPHA * logits_mouth
-                    probs = torch.softmax(logits, dim=1)[0].cpu().numpy().astype(np.float32)
+            t0 = time.perf_counter()
+            frame = r["frame"]
 
-                # ---- smoothing ----
-                if ema_probs is None:
-                    ema_probs = probs
+            # ---- beautify the preview only (never on the inference thread) ----
+            if self.show_window or self.frame_holder is not None:
+                if self.beautify_mode == "preview":
+                    frame = self.beautify_fn(frame)
+                elif self.beautify_mode == "roi":
+                    for f in r["faces"]:
+                        x1, y1, x2, y2 = f["box"]
+                        if f["face_beautified"] is not None:
+                            frame[y1:y2, x1:x2] = f["face_beautified"]
+                        else:
+                            beautify_roi(frame, f["box"], self.beautify_fn)
+                self.metrics.add("beautify", (time.perf_counter() - t0) * 1000.0)
+
+            # ---- callback for desktop pet ----
+            if r["emotion_label"] is not None and self.callback is not None:
+                self.callback(r["emotion_label"], r["conf"], r["probs"])
+            if r["faces"] and self.faces_callback is not None:
+                self.faces_callback(r["faces"])
+
+            # ---- discrete change events; shared_state is only written on change ----
+            if r["state_label"] is not None:
+                for event in self.events.update(r["emotion_label"], r["conf"], r["probs"]):
+                    self._emit_event(event)
+
+            # ---- send frame to Streamlit ----
+            if self.frame_holder is not None:
+                publish = getattr(self.frame_holder, "publish", None)
+                if publish is not None:
+                    publish(frame, r)   # shared-memory ring (shm_stream.py): one copy, no pickling
                 else:
-                    ema_probs = ema_alpha * ema_probs + (1 - ema_alpha) * probs
+                    self.frame_holder["frame"] = frame.copy()
 
-                # merge Fear into Surprise (your original logic)
-                ema_probs[6] += ema_probs[2]
-                ema_probs[2] = 0
+            # FPS calculation
+            now = time.perf_counter()
+            fps = 0.9 * fps + 0.1 * (1.0 / max(now - prev_time, 1e-6))
+            prev_time = now
+            self.metrics.add("end_to_end", (now - r["t_capture"]) * 1000.0)
+            self.metrics.incr("results")
 
-                cls = int(np.argmax(ema_probs))
-                conf = float(ema_probs[cls])
-                emotion_label = emotion_labels[cls]
+            # ---- periodic stats snapshot (state / callback / file) ----
+            if now - last_stats >= stats_interval:
+                last_stats = now
+                self._publish_stats(stats_file)
 
-                label_text = f"{emotion_label} {conf*100:.1f}%"
+            if self.show_window:
+                if self.multi_face:
+                    for f in r["faces"]:
+                        x1, y1, x2, y2 = f["box"]
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0,255,0), 2)
+                        cv2.putText(frame, f"#{f['id']} {f['label']}", (x1, max(15, y1 - 8)),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
+                cv2.putText(frame, r["label_text"], (20, 80),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
+                cv2.putText(frame, f"FPS: {fps:.1f}", (20,40),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,255), 2)
+                cv2.putText(frame, f"Latency: {self.metrics.ms['end_to_end']:.0f} ms", (20,120),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,255,255), 2)
 
-                # ---- callback for desktop pet ----
-                if callback is not None:
-                    callback(emotion_label, conf, ema_probs.copy())
+                cv2.imshow("FER-7cls", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
 
-                # ---- write to shared_state (for Streamlit UI) ----
-                if state is not None:
-                    state["detected_emotion"] = emotion_label
-        else:
-            # ---- no face detected ----
-            if state is not None:
-                state["detected_emotion"] = "No face"
-
-        # ---- send frame to Streamlit ----
-        if frame_holder is not None:
-            frame_holder["frame"] = frame.copy()
-
-        # FPS calculation
-        now = time.time()
-        fps = 0.9 * fps + 0.1 * (1.0 / (now - prev_time))
-        prev_time = now
-
-        if show_window:
-            cv2.putText(frame, label_text, (20, 80),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,0), 2)
-            cv2.putText(frame, f"FPS: {fps:.1f}", (20,40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0,255,255), 2)
-
-            cv2.imshow("FER-7cls", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-        else:
-            cv2.waitKey(1)
+            self.metrics.add("consume", (time.perf_counter() - t0) * 1000.0)
+
+    def _emit_event(self, event):
+        self.metrics.incr("emotion_events")
+        if self.state is not None:
+            if event["type"] == "changed":
+                self.state["detected_emotion"] = event["label"]
+            else:
+                self.state["emotion_snapshot"] = event
+        if self.event_callback is not None:
+            self.event_callback(event)
+
+    # ---------- control handle ----------
+    @property
+    def paused(self):
+        return not self._active.is_set()
+
+    @property
+    def running(self):
+        """True while a stream started with start() is still running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def pause(self):
+        """Release the camera and stop inferring until resume()"""
+        self._active.clear()
+
+    def resume(self):
+        self._active.set()
+
+    def stop(self, timeout=2.0):
+        """End the stream; waits for the background thread if start() was used"""
+        self._stop.set()
+        self._active.set()   # wake a paused capture stage so it can exit
+        self.frames.close()
+        self.results.close()
+        t = self._thread
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout=timeout)
+
+    def start(self):
+        """Run the stream on a daemon thread and return self as the handle"""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
 
-    cap.release()
-    cv2.destroyAllWindows()
+    # ---------- stats ----------
+    def stats(self):
+        """
+        Snapshot of counters and per-stage latency histograms, e.g.
+        {"counters": {"frames_captured": ..., "frames_dropped": ...},
+         "stages": {"infer": {"p50_ms": ..., "p95_ms": ...}}, ...}
+        """
+        snap = self.metrics.snapshot()
+        counters = snap["counters"]
+        counters["frames_dropped"] = self.frames.dropped
+        counters["results_dropped"] = self.results.dropped
+        if self.governor is not None:
+            snap["governor"] = self.governor.snapshot()
+        if self.crop_cache is not None:
+            snap["crop_cache"] = self.crop_cache.snapshot()
+        return snap
+
+    def _publish_stats(self, stats_file=None):
+        if self.state is None and self.stats_callback is None and not stats_file:
+            return
+        snap = self.stats()
+        if self.state is not None:
+            self.state["stream_stats"] = snap
+        if self.stats_callback is not None:
+            self.stats_callback(snap)
+        if stats_file:
+            try:
+                dump_stats(snap, stats_file)
+            except OSError as e:
+                print("[real_time] Failed to write stats file:", e)
+
+    # ---------- run ----------
+    def run(self):
+        print("[real_time] Starting emotion detection stream...")
+
+        # weights load in the background while the camera opens
+        if isinstance(self.backend, EmotionEngine):
+            self.backend.load_async()
+
+        cap = self.source
+        if cap is None:
+            cap = open_source(self.config.get("frame_source", 0),
+                              pacing=self.config.get("frame_pacing", "realtime"))
+        if self.config.get("record_path"):
+            cap = RecordingSource(cap, self.config["record_path"])
+        if not cap.isOpened():
+            print("❌ Cannot open camera / frame source")
+            return
+        # fast replays hand every frame to inference instead of dropping
+        self.frames.lossless = self.results.lossless = getattr(cap, "lossless", False)
+
+        detector = FaceDetector()
+        # the ROI tracker follows a single face; multi-face mode detects every frame
+        if self.config.get("face_tracking") and not self.multi_face:
+            detector = FaceTracker(detector, detect_every=self.config.get("detect_every", 10))
+
+        threads = [
+            threading.Thread(target=self._capture_loop, args=(cap,), daemon=True),
+            threading.Thread(target=self._infer_loop, args=(detector,), daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            self._consume_loop()
+        finally:
+            self._stop.set()
+            self.frames.close()
+            self.results.close()
+            for t in threads:
+                t.join(timeout=2.0)
+            if self.show_window:
+                cv2.destroyAllWindows()
+
+
+def start_emotion_stream(callback=None, show_window=True, frame_holder=None, state=None,
+                         backend=None, engine=None, faces_callback=None, source=None,
+                         stats_callback=None, event_callback=None, background=False):
+    """
+    Run the emotion pipeline on the calling thread until the camera stops,
+    'q' is pressed in the preview window or stop() is called.
+    With background=True it runs on a daemon thread instead and the
+    EmotionStream is returned right away as a pause/resume/stop handle.
+    callback(label, conf, probs) receives the largest face; with
+    "multi_face" enabled, faces_callback(faces) receives every face as a
+    dict with id / box / label / conf / probs.
+    event_callback(event) only fires when the emotion changes (with
+    hysteresis), plus optional low-rate snapshots; see emotion_events.py.
+    Prefer it over the per-frame callback for UI updates.
+    source: any frame_sources.FrameSource (default: from pet_config.json, camera 0).
+    Every "stats_interval" seconds a stats snapshot (see EmotionStream.stats)
+    goes to state["stream_stats"], stats_callback(snapshot) and "stats_file".
+    """
+    stream = EmotionStream(
+        callback=callback,
+        show_window=show_window,
+        frame_holder=frame_holder,
+        state=state,
+        backend=backend,
+        engine=engine,
+        faces_callback=faces_callback,
+        source=source,
+        stats_callback=stats_callback,
+        event_callback=event_callback,
+    )
+    if background:
+        return stream.start()
+    stream.run()
+    return stream
 
 
-print("Starting emotion detection stream...")
+MODULE_IMPORT_S = time.perf_counter() - _import_t0
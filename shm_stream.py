@@ -0,0 +1,333 @@
+"""
+Emotion Stream in a Dedicated Process (Shared Memory)
+-----------------------------------------------------
+Runs real_time.EmotionStream in its own process, so camera capture,
+detection and the model never compete with the pet's UI thread for the
+GIL, and publishes its output through shared memory instead of a
+multiprocessing Manager dict (which pickles every frame and sends it over
+a socket).
+
+- FrameRing:   ring of frame slots in one shared-memory block. The writer
+               copies each preview frame in once; readers get a numpy view
+               of the newest slot (no copy, no pickle) and can check that
+               the slot was not overwritten while they used it.
+- ResultSlot:  fixed-layout latest result (label, confidence, probabilities,
+               box, current emotion from the change events), written with a
+               seqlock: readers retry instead of taking a lock.
+- EmotionProcess: owns both blocks and the child process, with
+               pause / resume / stop like EmotionStream.
+
+Other processes (e.g. the Streamlit panel) attach to the blocks by name:
+    ring = FrameRing(name=state["frame_ring"])
+    seq, frame = ring.latest()
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import multiprocessing as mp
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+from real_time import emotion_labels
+
+NO_FACE_INDEX = len(emotion_labels)   # label index used for "No face"
+
+
+def _open_shm(name, size):
+    """Create a block (name=None) or attach to an existing one"""
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size), True
+    # only the creator may unlink the block, so attaching processes must not
+    # register it with the resource tracker (which unlinks on exit)
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)   # Python 3.13+
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+    return shm, False
+
+
+def _encode_label(label):
+    if label is None:
+        return -1
+    if label == "No face":
+        return NO_FACE_INDEX
+    return emotion_labels.index(label)
+
+
+def _decode_label(idx):
+    if idx < 0:
+        return None
+    if idx == NO_FACE_INDEX:
+        return "No face"
+    return emotion_labels[idx]
+
+
+# =========================
+# 1. Frame ring buffer
+# =========================
+class FrameRing:
+    """
+    Header: int64 [latest_index, n_slots, max_h, max_w]
+    Per slot: int64 [index, h, w, capture_seq, time_ns] + max_h*max_w*3 bytes.
+    A slot whose index field is -1 is being written.
+    """
+    def __init__(self, name=None, slots=4, max_size=(1280, 720)):
+        header = 4 * 8
+        max_w, max_h = max_size
+        self.shm, self.owner = _open_shm(name, header + slots * (5 * 8 + max_h * max_w * 3))
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        self.header = np.ndarray((4,), np.int64, buf, 0)
+        if self.owner:
+            self.header[:] = (0, slots, max_h, max_w)
+        else:
+            slots, max_h, max_w = (int(v) for v in self.header[1:4])
+        meta = slots * 5 * 8
+        self.meta = np.ndarray((slots, 5), np.int64, buf, header)
+        self.data = np.ndarray((slots, max_h, max_w, 3), np.uint8, buf, header + meta)
+        self.slots, self.max_h, self.max_w = slots, max_h, max_w
+        if self.owner:
+            self.meta[:, 0] = 0
+
+    # ---------- writer (single process) ----------
+    def write(self, frame, capture_seq=0):
+        h, w = frame.shape[:2]
+        if h > self.max_h or w > self.max_w:
+            s = min(self.max_h / h, self.max_w / w)
+            frame = cv2.resize(frame, (int(w * s), int(h * s)), interpolation=cv2.INTER_AREA)
+            h, w = frame.shape[:2]
+
+        index = int(self.header[0]) + 1
+        slot = index % self.slots
+        meta = self.meta[slot]
+        meta[0] = -1
+        self.data[slot, :h, :w] = frame
+        meta[1:] = (h, w, capture_seq, time.time_ns())
+        meta[0] = index
+        self.header[0] = index
+        return index
+
+    # ---------- readers ----------
+    def latest(self):
+        """(index, frame view) of the newest complete frame, or (0, None)"""
+        index = int(self.header[0])
+        if index <= 0:
+            return 0, None
+        meta = self.meta[index % self.slots]
+        h, w = int(meta[1]), int(meta[2])
+        if int(meta[0]) != index:
+            return 0, None   # overwritten between the two reads, try again later
+        return index, self.data[index % self.slots, :h, :w]
+
+    def valid(self, index):
+        """True while the slot of `index` has not been reused by the writer"""
+        return int(self.meta[index % self.slots, 0]) == index
+
+    def close(self):
+        self.header = self.meta = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# =========================
+# 2. Lock-free result slot
+# =========================
+class ResultSlot:
+    """
+    int64  [version, seq, label, event_label, event_count]
+    float64 [conf, time, probs x7, box x4]
+    The writer makes `version` odd while it updates the fields; readers retry
+    until they copy the fields under the same even version, at most
+    MAX_RETRIES times (a writer that died mid-update leaves the version odd
+    for good), and otherwise return the last result they read cleanly.
+    """
+    N_INT = 5
+    N_FLOAT = 2 + len(emotion_labels) + 4
+    MAX_RETRIES = 100
+
+    def __init__(self, name=None):
+        self.shm, self.owner = _open_shm(name, 8 * (self.N_INT + self.N_FLOAT))
+        self.name = self.shm.name
+        self.ints = np.ndarray((self.N_INT,), np.int64, self.shm.buf, 0)
+        self.floats = np.ndarray((self.N_FLOAT,), np.float64, self.shm.buf, 8 * self.N_INT)
+        if self.owner:
+            self.ints[:] = (0, 0, -1, -1, 0)
+            self.floats[:] = 0.0
+        self._last = self._decode(np.array((0, 0, -1, -1, 0), np.int64),
+                                  np.zeros(self.N_FLOAT, np.float64))
+
+    def write(self, seq, label, conf, probs, box, event_label, event_count):
+        ints, floats = self.ints, self.floats
+        ints[0] += 1
+        ints[1:] = (seq, _encode_label(label), _encode_label(event_label), event_count)
+        floats[0] = conf
+        floats[1] = time.time()
+        floats[2:9] = 0.0 if probs is None else probs
+        floats[9:13] = box if box is not None else (0, 0, 0, 0)
+        ints[0] += 1
+
+    def read(self):
+        for _ in range(self.MAX_RETRIES):
+            v1 = int(self.ints[0])
+            if v1 % 2 == 0:
+                ints = self.ints.copy()
+                floats = self.floats.copy()
+                if int(self.ints[0]) == v1:
+                    self._last = self._decode(ints, floats)
+                    break
+            time.sleep(0)
+        return self._last
+
+    @staticmethod
+    def _decode(ints, floats):
+        has_face = 0 <= ints[2] < NO_FACE_INDEX
+        return {
+            "seq": int(ints[1]),
+            "label": _decode_label(int(ints[2])),
+            "event_label": _decode_label(int(ints[3])),
+            "event_count": int(ints[4]),
+            "conf": float(floats[0]),
+            "t": float(floats[1]),
+            "probs": floats[2:9].astype(np.float32) if has_face else None,
+            "box": tuple(int(v) for v in floats[9:13]) if has_face else None,
+        }
+
+    def close(self):
+        self.ints = self.floats = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# =========================
+# 3. Publisher (child side)
+# =========================
+class ShmPublisher:
+    """
+    Passed to EmotionStream as frame_holder: the stream calls publish()
+    once per result instead of frame_holder["frame"] = frame.copy().
+    """
+    def __init__(self, ring, result):
+        self.ring = ring
+        self.result = result
+        self.event_label = None
+        self.event_count = 0
+
+    def on_event(self, event):
+        if event["type"] == "changed":
+            self.event_label = event["label"]
+            self.event_count += 1
+
+    def publish(self, frame, r):
+        self.ring.write(frame, r["seq"])
+        self.result.write(r["seq"], r["state_label"], r["conf"], r["probs"], r["box"],
+                          self.event_label, self.event_count)
+
+
+def _run_emotion_process(ring_name, result_name, config, state, show_window, stop, active):
+    from real_time import EmotionEngine, EmotionStream
+
+    # the pet is usually ended with Process.terminate(), so its stop() never
+    # runs: watch the parent and shut down (camera, shared memory) with it
+    parent = mp.parent_process()
+
+    ring = FrameRing(name=ring_name)
+    result = ResultSlot(name=result_name)
+    publisher = ShmPublisher(ring, result)
+    stream = EmotionStream(
+        show_window=show_window,
+        frame_holder=publisher,
+        state=state,
+        config=config,
+        engine=EmotionEngine(config) if config is not None else None,
+        event_callback=publisher.on_event,
+    ).start()
+    orphaned = False
+    try:
+        paused = False
+        while not stop.wait(0.1) and stream.running:
+            if parent is not None and not parent.is_alive():
+                print("[shm_stream] Parent process exited, stopping the emotion stream")
+                orphaned = True
+                break
+            if active.is_set() == paused:
+                paused = not paused
+                if paused:
+                    stream.pause()
+                else:
+                    stream.resume()
+    finally:
+        stream.stop()
+        # the owner is gone and cannot unlink the blocks any more
+        ring.owner = result.owner = orphaned
+        ring.close()
+        result.close()
+
+
+# =========================
+# 4. Parent-side handle
+# =========================
+class EmotionProcess:
+    """
+    Start the emotion stream in a child process and read its output from
+    shared memory. pause() / resume() / stop() mirror EmotionStream.
+    """
+    def __init__(self, config=None, state=None, show_window=False, slots=4,
+                 max_size=(1280, 720)):
+        self.frames = FrameRing(slots=slots, max_size=max_size)
+        self.results = ResultSlot()
+        self._stop = mp.Event()
+        self._active = mp.Event()
+        self._active.set()
+        self.process = mp.Process(
+            target=_run_emotion_process,
+            args=(self.frames.name, self.results.name, config, state, show_window,
+                  self._stop, self._active),
+            daemon=True,
+        )
+        if state is not None:
+            # preview consumers in other processes attach by name
+            state["frame_ring"] = self.frames.name
+            state["result_slot"] = self.results.name
+
+    def start(self):
+        self.process.start()
+        return self
+
+    @property
+    def paused(self):
+        return not self._active.is_set()
+
+    def pause(self):
+        self._active.clear()
+
+    def resume(self):
+        self._active.set()
+
+    def latest_result(self):
+        return self.results.read()
+
+    def latest_frame(self):
+        return self.frames.latest()
+
+    def stop(self, timeout=3.0):
+        self._stop.set()
+        self._active.set()
+        if self.process.pid is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.frames.close()
+        self.results.close()
@@ -0,0 +1,127 @@
+"""
+Runtime Metrics for the Emotion Stream
+--------------------------------------
+Low-overhead instrumentation for real_time.EmotionStream: per-stage latency
+histograms with fixed log-spaced buckets, a moving average per stage (used
+by the preview overlay) and simple event counters. Recording a sample is a
+bisect over ~60 bucket bounds plus a few integer updates, with no allocation,
+so it is safe to call on every frame of every stage.
+
+Each stage / counter is written by a single pipeline thread; snapshot()
+can be called from any thread and returns plain dicts/floats that are
+cheap to pickle into a Manager dict or dump as JSON.
+
+Authors: Xiaoqing Zhu, Yizhou Zhang, Hsin Wang
+University of Pennsylvania
+Date: December 2025
+"""
+
+import json
+import os
+import time
+from bisect import bisect_left
+
+
+# =========================
+# 1. Moving-average stage timer
+# =========================
+class StageTimer:
+    """
+    Exponential moving average of per-stage latency in milliseconds.
+    Each stage is written by a single thread; snapshot() may be called from any.
+    """
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.ms = {}
+
+    def add(self, stage, ms):
+        prev = self.ms.get(stage)
+        self.ms[stage] = ms if prev is None else (1 - self.alpha) * prev + self.alpha * ms
+
+    def snapshot(self):
+        return dict(self.ms)
+
+
+# =========================
+# 2. Latency histogram
+# =========================
+# bucket upper bounds: 0.05 ms .. ~10 s, 25% apart
+BUCKET_BOUNDS_MS = [0.05 * 1.25 ** i for i in range(56)]
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)   # last bucket = overflow
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (q in 0..100)"""
+        if self.count == 0:
+            return 0.0
+        target = q / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c:
+                return BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+        }
+
+
+# =========================
+# 3. Stream metrics
+# =========================
+class StreamMetrics(StageTimer):
+    """
+    StageTimer plus a LatencyHistogram per stage and named counters
+    (frames_captured, detection_misses, inferences, ...).
+    """
+    def __init__(self, alpha=0.1):
+        super().__init__(alpha)
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def add(self, stage, ms):
+        super().add(stage, ms)
+        hist = self.histograms.get(stage)
+        if hist is None:
+            hist = self.histograms[stage] = LatencyHistogram()
+        hist.record(ms)
+
+    def incr(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self):
+        return {
+            "uptime_s": time.time() - self.started,
+            "counters": dict(self.counters),
+            "stages": {name: h.snapshot() for name, h in list(self.histograms.items())},
+            "ema_ms": dict(self.ms),
+        }
+
+
+def dump_stats(snapshot, path):
+    """Write a stats snapshot as JSON, atomically (readers never see a partial file)"""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(tmp, path)